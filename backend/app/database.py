@@ -2,7 +2,10 @@
 MongoDB Database Configuration and Initialization
 数据库配置模块 - 负责初始化MongoDB连接和Beanie ODM
 """
+import asyncio
+import logging
 import os
+from typing import List, Optional
 from motor.motor_asyncio import AsyncIOMotorClient
 from beanie import init_beanie
 from app.models import Game, User, SentimentLog, UserPreference
@@ -12,16 +15,32 @@ from app.models import Game, User, SentimentLog, UserPreference
 MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
 DATABASE_NAME = os.getenv("DATABASE_NAME", "steamgamerec")
 
+# 连接池配置 (默认值按 2个uvicorn worker × 并发请求 估算)
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", "100"))
+MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", "10"))
+MONGODB_MAX_IDLE_TIME_MS = int(os.getenv("MONGODB_MAX_IDLE_TIME_MS", "30000"))
+
+# 情感分析日志批量写入配置
+SENTIMENT_LOG_BATCH_SIZE = int(os.getenv("SENTIMENT_LOG_BATCH_SIZE", "50"))
+SENTIMENT_LOG_FLUSH_INTERVAL_MS = float(os.getenv("SENTIMENT_LOG_FLUSH_INTERVAL_MS", "200"))
+
+logger = logging.getLogger(__name__)
+
 
 async def init_db():
     """
     初始化数据库连接
-    - 创建异步MongoDB客户端
+    - 创建异步MongoDB客户端 (显式配置连接池, 预热最小连接数)
     - 初始化Beanie ODM并注册所有Document模型
     - 在Kubernetes中,此函数在应用启动时调用
     """
     # 创建MongoDB异步客户端
-    client = AsyncIOMotorClient(MONGODB_URL)
+    client = AsyncIOMotorClient(
+        MONGODB_URL,
+        maxPoolSize=MONGODB_MAX_POOL_SIZE,
+        minPoolSize=MONGODB_MIN_POOL_SIZE,
+        maxIdleTimeMS=MONGODB_MAX_IDLE_TIME_MS
+    )
     
     # 初始化Beanie - 注册所有Document模型
     await init_beanie(
@@ -40,3 +59,79 @@ async def close_db():
     """
     # Beanie会自动处理连接池关闭
     print("🔒 Database connection closed")
+
+
+# ============================================
+# 情感分析日志后台批量写入
+# ============================================
+class SentimentLogWriter:
+    """
+    SentimentLog后台写入器
+    - /analyze 把日志放入队列后立即返回, 不再在请求路径上等待MongoDB往返
+    - 后台任务每凑满SENTIMENT_LOG_BATCH_SIZE条或每SENTIMENT_LOG_FLUSH_INTERVAL_MS毫秒批量insert_many一次
+    - 关闭时写完队列中剩余的日志
+    """
+
+    def __init__(self, batch_size: int = SENTIMENT_LOG_BATCH_SIZE,
+                 flush_interval_ms: float = SENTIMENT_LOG_FLUSH_INTERVAL_MS):
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """启动后台写入任务 (需在事件循环中调用)"""
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """写完剩余日志后停止后台任务"""
+        if self._task is None:
+            return
+        self._queue.put_nowait(None)  # 结束标记
+        await self._task
+        self._task = None
+
+    def submit(self, log: SentimentLog):
+        """提交一条日志 (不等待写入完成)"""
+        self.start()
+        self._queue.put_nowait(log)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            log = await self._queue.get()
+            if log is None:
+                return
+            batch = [log]
+            deadline = loop.time() + self._flush_interval
+
+            stopping = False
+            while len(batch) < self._batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    log = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if log is None:
+                    stopping = True
+                    break
+                batch.append(log)
+
+            await self._flush(batch)
+            if stopping:
+                return
+
+    async def _flush(self, batch: List[SentimentLog]):
+        try:
+            await SentimentLog.insert_many(batch)
+        except Exception as e:
+            # 日志写入失败不影响已返回的分析结果
+            logger.error(f"Failed to write {len(batch)} sentiment logs: {e}")
+
+
+# 全局日志写入器实例 (在应用lifespan中启动和停止)
+sentiment_log_writer = SentimentLogWriter()
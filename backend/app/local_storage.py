@@ -2,48 +2,174 @@
 本地用户偏好存储 - SQLite数据库
 用于存储用户点击历史、游戏偏好等隐私数据
 """
+import asyncio
 import sqlite3
-import json
-from datetime import datetime, timezone
-from typing import Dict, List, Optional
+import threading
+import orjson
+from contextlib import contextmanager
+import time
+from typing import Dict, Iterable, List, Optional
 import os
 
 # 数据库文件路径
 DB_PATH = os.getenv("USER_PREFS_DB", "/app/data/user_preferences.db")
 
+# SQLite性能参数 (每个连接都需要设置, journal_mode=WAL会持久化到数据库文件)
+# - WAL: 写操作追加到日志, 读写互不阻塞
+# - synchronous=NORMAL: WAL模式下只在checkpoint时fsync, 每次提交不再同步刷盘
+# - cache_size=-65536: 64MB页缓存 (负数单位为KB)
+# - mmap_size: 256MB内存映射读取
+# - busy_timeout: 锁冲突时等待3秒而不是立即报错
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA busy_timeout=3000",
+)
+
+# sqlite3模块内部的预编译语句缓存容量 (默认128)
+SQLITE_CACHED_STATEMENTS = 256
+
+# ============================================
+# 热路径SQL语句 (模块级常量, 复用同一字符串以命中预编译语句缓存)
+# ============================================
+SQL_GET_USER = "SELECT 1 FROM user_preferences WHERE user_id = ?"
+
+SQL_TOUCH_USER = """
+    INSERT INTO user_preferences (user_id, updated_at)
+    VALUES (?, ?)
+    ON CONFLICT(user_id) DO UPDATE SET
+        updated_at = excluded.updated_at
+"""
+
+SQL_GET_GENRE_WEIGHTS = "SELECT genre, weight FROM genre_weights WHERE user_id = ?"
+
+SQL_GET_CLICKED_GAMES = "SELECT app_id FROM clicked_games WHERE user_id = ?"
+
+# 原地累加多个类型的权重 (B+树行内更新, 不再整体重写JSON), 权重不低于0
+# 类型列表以JSON数组传入, 由JSON1的json_each展开, 一条语句完成全部UPSERT
+# (WHERE true 用于消除 INSERT ... SELECT ... ON CONFLICT 的语法歧义)
+SQL_INCREMENT_GENRE_WEIGHTS = """
+    INSERT INTO genre_weights (user_id, genre, weight)
+    SELECT ?, value, MAX(0, ?) FROM json_each(?) WHERE true
+    ON CONFLICT(user_id, genre) DO UPDATE SET
+        weight = MAX(0, genre_weights.weight + ?)
+"""
+
+# 同上, 并通过RETURNING直接返回更新后的权重 (无需额外SELECT)
+SQL_INCREMENT_GENRE_WEIGHTS_RETURNING = SQL_INCREMENT_GENRE_WEIGHTS + "RETURNING genre, weight"
+
+SQL_INSERT_GENRE_WEIGHT = "INSERT INTO genre_weights (user_id, genre, weight) VALUES (?, ?, ?)"
+
+SQL_DELETE_GENRE_WEIGHTS = "DELETE FROM genre_weights WHERE user_id = ?"
+
+SQL_ADD_CLICKED_GAME = "INSERT OR IGNORE INTO clicked_games (user_id, app_id) VALUES (?, ?)"
+
+SQL_DELETE_CLICKED_GAMES = "DELETE FROM clicked_games WHERE user_id = ?"
+
+SQL_UPSERT_CACHE = """
+    INSERT INTO game_cache (app_id, game_data, cached_at)
+    VALUES (?, ?, ?)
+    ON CONFLICT(app_id) DO UPDATE SET
+        game_data = excluded.game_data,
+        cached_at = excluded.cached_at
+"""
+
+SQL_GET_CACHE = """
+    SELECT game_data, cached_at FROM game_cache 
+    WHERE app_id = ? 
+    AND cached_at > ? - ? * 3600
+"""
+
+SQL_DELETE_EXPIRED_CACHE = """
+    DELETE FROM game_cache 
+    WHERE cached_at < ? - ? * 3600
+"""
+
 
 class UserPreferenceStore:
     """本地SQLite用户偏好存储"""
     
     def __init__(self, db_path: str = DB_PATH):
         self.db_path = db_path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()  # 共享连接的线程安全保护
         self._init_db()
     
+    def _connect(self) -> sqlite3.Connection:
+        """
+        创建长连接并应用性能参数
+        
+        - check_same_thread=False: 允许在FastAPI线程池中复用同一连接 (由self._lock串行化)
+        - isolation_level=None: 自动提交模式, 单条语句无需额外commit
+        - cached_statements: 扩大预编译语句缓存, 避免热路径SQL重复解析
+        """
+        conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            isolation_level=None,
+            cached_statements=SQLITE_CACHED_STATEMENTS
+        )
+        for pragma in SQLITE_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+    
+    @contextmanager
+    def _transaction(self):
+        """在共享连接上开启显式事务 (调用方需持有self._lock)"""
+        self._conn.execute("BEGIN")
+        try:
+            yield self._conn
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        else:
+            self._conn.execute("COMMIT")
+    
     def _init_db(self):
-        """初始化数据库表"""
+        """初始化数据库连接和表"""
         # 确保目录存在
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        self._conn = self._connect()
+        cursor = self._conn.cursor()
         
-        # 创建用户偏好表
+        # 创建用户表 (偏好数据存储在下面的规范化表中)
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS user_preferences (
                 user_id TEXT PRIMARY KEY,
-                genre_weights TEXT,
-                clicked_games TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                created_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+                updated_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
             )
         """)
         
+        # 创建类型权重表 (每个用户每个类型一行)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS genre_weights (
+                user_id TEXT NOT NULL,
+                genre TEXT NOT NULL,
+                weight INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, genre)
+            ) WITHOUT ROWID
+        """)
+        
+        # 创建点击记录表
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS clicked_games (
+                user_id TEXT NOT NULL,
+                app_id INTEGER NOT NULL,
+                PRIMARY KEY (user_id, app_id)
+            ) WITHOUT ROWID
+        """)
+        
         # 创建游戏缓存表
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS game_cache (
                 app_id INTEGER PRIMARY KEY,
                 game_data TEXT,
-                cached_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                cached_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
             )
         """)
         
@@ -58,55 +184,99 @@ class UserPreferenceStore:
             ON game_cache(cached_at)
         """)
         
-        conn.commit()
-        conn.close()
+        self._migrate_legacy_preferences()
+        self._migrate_text_timestamps()
         print(f"✅ SQLite数据库初始化完成: {self.db_path}")
     
+    def _migrate_legacy_preferences(self):
+        """将旧版本JSON列中的偏好数据迁移到规范化表, 并删除旧的JSON列 (一次性)"""
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(user_preferences)")}
+        if "genre_weights" not in columns:
+            return
+        
+        rows = self._conn.execute("""
+            SELECT user_id, genre_weights, clicked_games FROM user_preferences
+            WHERE genre_weights IS NOT NULL OR clicked_games IS NOT NULL
+        """).fetchall()
+        
+        with self._transaction() as conn:
+            for user_id, genre_weights, clicked_games in rows:
+                weights = orjson.loads(genre_weights) if genre_weights else {}
+                clicks = orjson.loads(clicked_games) if clicked_games else []
+                conn.executemany(
+                    "INSERT OR REPLACE INTO genre_weights (user_id, genre, weight) VALUES (?, ?, ?)",
+                    [(user_id, genre, weight) for genre, weight in weights.items()]
+                )
+                conn.executemany(SQL_ADD_CLICKED_GAME, [(user_id, app_id) for app_id in clicks])
+            # 需要SQLite 3.35+ (python:3.11镜像自带3.40)
+            conn.execute("ALTER TABLE user_preferences DROP COLUMN genre_weights")
+            conn.execute("ALTER TABLE user_preferences DROP COLUMN clicked_games")
+        
+        print(f"🔄 已迁移 {len(rows)} 个用户的偏好数据到规范化表")
+    
+    def _migrate_text_timestamps(self):
+        """将旧版本的ISO字符串时间戳转换为Unix时间戳整数 (一次性)"""
+        with self._transaction() as conn:
+            for table, column in (
+                ("user_preferences", "created_at"),
+                ("user_preferences", "updated_at"),
+                ("game_cache", "cached_at"),
+            ):
+                conn.execute(f"""
+                    UPDATE {table} SET {column} = CAST(strftime('%s', {column}) AS INTEGER)
+                    WHERE typeof({column}) = 'text'
+                """)
+    
+    def close(self):
+        """关闭数据库连接 (应用关闭时调用)"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+    
     # ============================================
     # 用户偏好操作
     # ============================================
     
     def get_user_preference(self, user_id: str) -> Optional[Dict]:
         """获取用户偏好"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            "SELECT genre_weights, clicked_games FROM user_preferences WHERE user_id = ?",
-            (user_id,)
-        )
+        with self._lock:
+            if self._conn.execute(SQL_GET_USER, (user_id,)).fetchone() is None:
+                return None
+            weight_rows = self._conn.execute(SQL_GET_GENRE_WEIGHTS, (user_id,)).fetchall()
+            click_rows = self._conn.execute(SQL_GET_CLICKED_GAMES, (user_id,)).fetchall()
         
-        row = cursor.fetchone()
-        conn.close()
-        
-        if row:
-            return {
-                "genre_weights": json.loads(row[0]) if row[0] else {},
-                "clicked_games": json.loads(row[1]) if row[1] else []
-            }
-        return None
+        return {
+            "genre_weights": dict(weight_rows),
+            "clicked_games": [row[0] for row in click_rows]
+        }
     
     def save_user_preference(self, user_id: str, genre_weights: Dict[str, int], clicked_games: List[int]):
-        """保存用户偏好"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            INSERT INTO user_preferences (user_id, genre_weights, clicked_games, updated_at)
-            VALUES (?, ?, ?, ?)
-            ON CONFLICT(user_id) DO UPDATE SET
-                genre_weights = excluded.genre_weights,
-                clicked_games = excluded.clicked_games,
-                updated_at = excluded.updated_at
-        """, (
-            user_id,
-            json.dumps(genre_weights),
-            json.dumps(clicked_games),
-            datetime.now(timezone.utc).isoformat()
-        ))
+        """保存用户偏好 (整体覆盖)"""
+        with self._lock, self._transaction() as conn:
+            conn.execute(SQL_TOUCH_USER, (user_id, int(time.time())))
+            conn.execute(SQL_DELETE_GENRE_WEIGHTS, (user_id,))
+            conn.executemany(
+                SQL_INSERT_GENRE_WEIGHT,
+                [(user_id, genre, weight) for genre, weight in genre_weights.items()]
+            )
+            conn.execute(SQL_DELETE_CLICKED_GAMES, (user_id,))
+            conn.executemany(SQL_ADD_CLICKED_GAME, [(user_id, app_id) for app_id in clicked_games])
+    
+    def update_genre_weights(self, user_id: str, genres: Iterable[str], increment: int = 1):
+        """批量更新多个类型的权重 (单条UPSERT语句, 权重不低于0)
         
-        conn.commit()
-        conn.close()
+        Args:
+            user_id: 用户ID
+            genres: 游戏类型列表
+            increment: 权重增量（默认1，点击=1，加入愿望单=5，移出愿望单=-5）
+        """
+        with self._lock, self._transaction() as conn:
+            conn.execute(SQL_TOUCH_USER, (user_id, int(time.time())))
+            conn.execute(
+                SQL_INCREMENT_GENRE_WEIGHTS,
+                (user_id, increment, orjson.dumps(list(genres)).decode(), increment)
+            )
     
     def update_genre_weight(self, user_id: str, genre: str, increment: int = 1):
         """更新单个类型的权重
@@ -116,26 +286,30 @@ class UserPreferenceStore:
             genre: 游戏类型
             increment: 权重增量（默认1，点击=1，加入愿望单=5）
         """
-        prefs = self.get_user_preference(user_id)
-        
-        if prefs is None:
-            prefs = {"genre_weights": {}, "clicked_games": []}
-        
-        prefs["genre_weights"][genre] = prefs["genre_weights"].get(genre, 0) + increment
-        
-        self.save_user_preference(user_id, prefs["genre_weights"], prefs["clicked_games"])
+        self.update_genre_weights(user_id, [genre], increment)
     
     def add_clicked_game(self, user_id: str, app_id: int):
         """添加点击的游戏"""
-        prefs = self.get_user_preference(user_id)
-        
-        if prefs is None:
-            prefs = {"genre_weights": {}, "clicked_games": []}
-        
-        if app_id not in prefs["clicked_games"]:
-            prefs["clicked_games"].append(app_id)
+        with self._lock, self._transaction() as conn:
+            conn.execute(SQL_TOUCH_USER, (user_id, int(time.time())))
+            conn.execute(SQL_ADD_CLICKED_GAME, (user_id, app_id))
+    
+    def record_click(self, user_id: str, app_id: int, genres: Iterable[str]) -> Dict[str, int]:
+        """
+        记录一次游戏点击: 类型权重各+1并加入点击记录 (单个事务, 无SELECT)
         
-        self.save_user_preference(user_id, prefs["genre_weights"], prefs["clicked_games"])
+        Returns:
+            Dict: 本次点击涉及的类型及其更新后的权重
+        """
+        with self._lock, self._transaction() as conn:
+            conn.execute(SQL_TOUCH_USER, (user_id, int(time.time())))
+            # RETURNING的结果必须全部取出, 语句才会执行完毕
+            updated = dict(conn.execute(
+                SQL_INCREMENT_GENRE_WEIGHTS_RETURNING,
+                (user_id, 1, orjson.dumps(list(genres)).decode(), 1)
+            ).fetchall())
+            conn.execute(SQL_ADD_CLICKED_GAME, (user_id, app_id))
+        return updated
     
     # ============================================
     # 游戏缓存操作
@@ -143,75 +317,61 @@ class UserPreferenceStore:
     
     def cache_game(self, app_id: int, game_data: Dict):
         """缓存游戏数据"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            INSERT INTO game_cache (app_id, game_data, cached_at)
-            VALUES (?, ?, ?)
-            ON CONFLICT(app_id) DO UPDATE SET
-                game_data = excluded.game_data,
-                cached_at = excluded.cached_at
-        """, (
-            app_id,
-            json.dumps(game_data),
-            datetime.now(timezone.utc).isoformat()
-        ))
-        
-        conn.commit()
-        conn.close()
+        with self._lock:
+            self._conn.execute(SQL_UPSERT_CACHE, (
+                app_id,
+                orjson.dumps(game_data).decode(),
+                int(time.time())
+            ))
     
     def get_cached_game(self, app_id: int, max_age_hours: int = 24) -> Optional[Dict]:
         """获取缓存的游戏数据（带过期检查）"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT game_data, cached_at FROM game_cache 
-            WHERE app_id = ? 
-            AND datetime(cached_at) > datetime('now', '-' || ? || ' hours')
-        """, (app_id, max_age_hours))
-        
-        row = cursor.fetchone()
-        conn.close()
+        with self._lock:
+            row = self._conn.execute(SQL_GET_CACHE, (app_id, int(time.time()), max_age_hours)).fetchone()
         
         if row:
-            return json.loads(row[0])
+            return orjson.loads(row[0])
         return None
     
     def clear_expired_cache(self, max_age_hours: int = 168):  # 默认7天
         """清理过期缓存"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            DELETE FROM game_cache 
-            WHERE datetime(cached_at) < datetime('now', '-' || ? || ' hours')
-        """, (max_age_hours,))
-        
-        deleted = cursor.rowcount
-        conn.commit()
-        conn.close()
+        with self._lock:
+            cursor = self._conn.execute(SQL_DELETE_EXPIRED_CACHE, (int(time.time()), max_age_hours))
+            deleted = cursor.rowcount
         
         print(f"🗑️  已清理 {deleted} 条过期缓存")
         return deleted
     
+    # ============================================
+    # 异步接口 (供FastAPI异步路由调用)
+    # ============================================
+    # 在线程池中执行同步方法, WAL追加/磁盘I/O期间释放事件循环;
+    # 共享连接由self._lock串行化, 与同步接口可以混用
+    
+    async def get_user_preference_async(self, user_id: str) -> Optional[Dict]:
+        return await asyncio.to_thread(self.get_user_preference, user_id)
+    
+    async def update_genre_weights_async(self, user_id: str, genres: Iterable[str], increment: int = 1):
+        return await asyncio.to_thread(self.update_genre_weights, user_id, list(genres), increment)
+    
+    async def record_click_async(self, user_id: str, app_id: int, genres: Iterable[str]) -> Dict[str, int]:
+        return await asyncio.to_thread(self.record_click, user_id, app_id, list(genres))
+    
+    async def cache_game_async(self, app_id: int, game_data: Dict):
+        return await asyncio.to_thread(self.cache_game, app_id, game_data)
+    
+    async def get_cached_game_async(self, app_id: int, max_age_hours: int = 24) -> Optional[Dict]:
+        return await asyncio.to_thread(self.get_cached_game, app_id, max_age_hours)
+    
     # ============================================
     # 统计信息
     # ============================================
     
     def get_stats(self) -> Dict:
         """获取存储统计信息"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT COUNT(*) FROM user_preferences")
-        user_count = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM game_cache")
-        cache_count = cursor.fetchone()[0]
-        
-        conn.close()
+        with self._lock:
+            user_count = self._conn.execute("SELECT COUNT(*) FROM user_preferences").fetchone()[0]
+            cache_count = self._conn.execute("SELECT COUNT(*) FROM game_cache").fetchone()[0]
         
         return {
             "total_users": user_count,
@@ -233,6 +393,14 @@ def get_preference_store() -> UserPreferenceStore:
     return _store
 
 
+def close_preference_store():
+    """关闭全局偏好存储的数据库连接"""
+    global _store
+    if _store is not None:
+        _store.close()
+        _store = None
+
+
 # ============================================
 # 测试代码
 # ============================================
@@ -272,4 +440,6 @@ if __name__ == "__main__":
     stats = store.get_stats()
     print(f"✅ 统计信息: {stats}")
     
+    store.close()
+    
     print("\n✅ 所有测试通过！")
@@ -11,20 +11,33 @@ API端点:
 - POST /analyze       - NLP情感分析
 - GET  /history       - 获取分析历史
 """
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from contextlib import asynccontextmanager
 from typing import List, Optional
 from datetime import datetime, timezone
 
-from app.database import init_db, close_db
-from app.models import Game, SentimentLog, SentimentRequest, SentimentResponse, UserPreference, User
-from app.nlp_service import predict_sentiment, warmup_model
+from app.database import init_db, close_db, sentiment_log_writer
+from app.models import (
+    Game, SentimentLog, SentimentRequest, SentimentResponse, UserPreference, User,
+    normalize_genres,
+)
+from app.nlp_service import predict_sentiment_async, sentiment_batcher, warmup_model
 from app.steam_service import steam_service
-from app.local_storage import get_preference_store
+from app.local_storage import get_preference_store, close_preference_store
+from app.recommend_service import game_index, recommendation_cache, rng
+from app.rec_kernels import gumbel_top_k, warmup_kernels
 
+import asyncio
 import logging
 import random
+import orjson
+import msgspec
+import numpy as np
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import DESCENDING, ReturnDocument
 
 # 配置日志
 logging.basicConfig(
@@ -34,36 +47,6 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-# ============================================
-# 辅助函数
-# ============================================
-def normalize_genres(genres):
-    """
-    规范化genres格式，确保返回正确的字符串数组
-    
-    处理以下情况:
-    - genres是字符串: "Action, Adventure" -> ["Action", "Adventure"]
-    - genres是包含单个逗号分隔字符串的数组: ["Action, Adventure"] -> ["Action", "Adventure"]
-    - genres已经是正确的数组: ["Action", "Adventure"] -> ["Action", "Adventure"]
-    """
-    if not genres:
-        return []
-    
-    # 如果是字符串，直接分割
-    if isinstance(genres, str):
-        return [g.strip() for g in genres.split(", ")] if genres else []
-    
-    # 如果是数组
-    if isinstance(genres, list):
-        # 检查是否是单个元素且包含逗号（需要分割的情况）
-        if len(genres) == 1 and isinstance(genres[0], str) and ", " in genres[0]:
-            return [g.strip() for g in genres[0].split(", ")]
-        # 已经是正确的数组格式
-        return genres
-    
-    return []
-
-
 # ============================================
 # 应用生命周期管理
 # ============================================
@@ -71,21 +54,28 @@ def normalize_genres(genres):
 async def lifespan(app: FastAPI):
     """
     应用启动和关闭时的钩子函数
-    - startup: 初始化数据库连接,预热NLP模型
+    - startup: 初始化数据库连接,构建推荐索引,预热NLP模型
     - shutdown: 关闭数据库连接
     """
     # Startup
     logger.info("Starting SteamGameRecSys Backend...")
     await init_db()
+    await game_index.refresh()  # 构建推荐用的游戏类型矩阵
+    warmup_kernels()  # 预编译推荐抽样内核
     warmup_model()  # 预热BERT模型
+    sentiment_batcher.start()  # 启动情感分析微批处理
+    sentiment_log_writer.start()  # 启动情感分析日志后台批量写入
     logger.info("Application ready!")
     
     yield
     
     # Shutdown
     logger.info("Shutting down...")
+    await sentiment_batcher.stop()
+    await sentiment_log_writer.stop()  # 写完剩余日志后再关闭数据库
     await close_db()
     await steam_service.close()
+    close_preference_store()
     logger.info("Goodbye!")
 
 
@@ -96,7 +86,8 @@ app = FastAPI(
     title="SteamGameRecSys API",
     description="Steam游戏推荐与智能分析系统 - 后端API",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse  # 使用orjson序列化所有响应 (比标准库json快数倍)
 )
 
 
@@ -122,7 +113,7 @@ async def root():
         "status": "healthy",
         "service": "SteamGameRecSys Backend",
         "version": "1.0.0",
-        "timestamp": datetime.now(timezone.utc).isoformat()
+        "timestamp": datetime.now(timezone.utc)  # orjson原生支持datetime序列化
     }
 
 
@@ -140,11 +131,10 @@ async def get_games(skip: int = 0, limit: int = 20):
     """
     try:
         games = await Game.find_all().skip(skip).limit(limit).to_list()
-        # 规范化genres格式并添加_id字段
+        # genres已在写入时规范化，这里只需添加_id字段
         result = []
         for game in games:
-            game_dict = game.dict()
-            game_dict["genres"] = normalize_genres(game.genres)
+            game_dict = game.model_dump()
             # 确保_id字段存在（前端需要）
             game_dict["_id"] = str(game.id)
             result.append(game_dict)
@@ -187,7 +177,7 @@ async def search_games(q: str, limit: int = 20):
         for game in name_matches + genre_matches:
             if game.id not in seen_ids:
                 seen_ids.add(game.id)
-                game_dict = game.dict()
+                game_dict = game.model_dump()
                 game_dict["genres"] = normalize_genres(game.genres)
                 game_dict["_id"] = str(game.id)
                 result.append(game_dict)
@@ -210,6 +200,7 @@ async def create_game(game: Game):
     """
     try:
         await game.insert()
+        game_index.invalidate()
         return game
     except Exception as e:
         logger.error(f"Failed to create game: {e}")
@@ -251,6 +242,7 @@ async def delete_game(game_id: str):
         if not game:
             raise HTTPException(status_code=404, detail="Game not found")
         await game.delete()
+        game_index.invalidate()
         return {"message": "Game deleted successfully", "game_id": game_id}
     except HTTPException:
         raise
@@ -296,11 +288,8 @@ async def get_top_steam_games(limit: int = 20):
     - limit: 返回数量 (默认20)
     """
     try:
-        games = await steam_service.get_top_games(limit)
-        # 规范化genres格式
-        for game in games:
-            game["genres"] = normalize_genres(game.get("genres", []))
-        return games
+        # steam_service在解析时已将genres拆分为字符串数组
+        return await steam_service.get_top_games(limit)
     except Exception as e:
         logger.error(f"Failed to fetch top games: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -309,6 +298,67 @@ async def get_top_steam_games(limit: int = 20):
 # ============================================
 # API路由 - 游戏推荐系统
 # ============================================
+async def compute_recommendations(prefs: Optional[dict], limit: int) -> list:
+    """
+    根据用户偏好计算推荐游戏列表 (不经过缓存)
+    
+    Args:
+        prefs: 本地SQLite中的用户偏好, 没有偏好时为None
+        limit: 返回数量
+    """
+    # 如果没有偏好或偏好为空，随机返回
+    if not prefs or not prefs.get("genre_weights"):
+        # 从内存游戏索引中随机抽取limit个下标，不再拉取并打乱整个游戏目录
+        index = await game_index.ensure_fresh()
+        if index.size == 0:
+            # 如果数据库中没有游戏，从Steam获取热门游戏
+            return await steam_service.get_top_games(limit)
+        
+        selected_idx = random.sample(range(index.size), min(limit, index.size))
+        return [dict(index.games[i]) for i in selected_idx]
+    
+    genre_weights = prefs["genre_weights"]
+    clicked_games = set(prefs.get("clicked_games", []))
+    
+    # 基础得分：偏好匹配（内存中的类型稀疏矩阵 × 用户权重向量）
+    index = await game_index.ensure_fresh()
+    
+    if index.size == 0:
+        # 如果数据库中没有游戏，从Steam获取热门游戏
+        return await steam_service.get_top_games(limit)
+    
+    base_scores = index.genre_scores(genre_weights)
+    
+    # 在基础得分上叠加随机性和热门度（整批向量化计算，scores与index.games按下标对应）
+    scores = base_scores
+    
+    # 添加较大的随机因子（增加多样性，避免总是推荐相同游戏）
+    # 随机因子范围：0-100%的基础得分，确保每次推荐都有显著变化；无偏好匹配时给予0-5的基础随机分
+    scores += rng.uniform(0, np.where(scores > 0, scores, 5))
+    
+    # 降低已点击游戏的权重（但不完全排除）
+    if clicked_games:
+        scores[np.isin(index.app_ids, list(clicked_games))] *= 0.7
+    
+    # 考虑评价数量（热门度）- 也添加随机波动
+    # popularity在游戏写入时已归一化到0-1
+    scores += index.popularity * rng.uniform(0.3, 0.8, index.size)  # 0.3-0.8随机权重
+    
+    # 完全随机化策略：从所有游戏中随机选择，但高分游戏概率更高
+    # 为了增加多样性，我们使用加权随机而不是简单排序
+    
+    # Gumbel-top-k：对 log(得分) 加Gumbel噪声后取前k个，
+    # 等价于按得分比例逐个做不放回加权抽样，结果顺序即抽中顺序
+    # 得分为0的游戏只在正分游戏不足时才会被选中（彼此之间完全随机）
+    k = max(0, min(limit, index.size))
+    if k == 0:
+        return []
+    selected_idx = gumbel_top_k(scores, k, rng)
+    
+    # 只为选中的limit个游戏复制响应字典（索引中的字典被多个请求共享）
+    return [dict(index.games[i]) for i in selected_idx]
+
+
 @app.get("/recommendations")
 async def get_recommendations(user_id: str = "default_user", limit: int = 10):
     """
@@ -320,126 +370,22 @@ async def get_recommendations(user_id: str = "default_user", limit: int = 10):
     
     推荐逻辑:
     1. 从本地SQLite获取用户偏好权重
-    2. 从云端MongoDB获取所有游戏
+    2. 从内存推荐索引（云端MongoDB游戏目录的缓存）获取所有游戏
     3. 计算匹配分数并引入随机性
     4. 80%基于偏好推荐 + 20%探索性推荐（增加多样性）
+    5. 相同偏好的结果缓存RECOMMENDATION_CACHE_TTL秒，点击后失效
     """
     try:
         # 使用本地SQLite获取用户偏好
         store = get_preference_store()
-        prefs = store.get_user_preference(user_id)
-        
-        # 获取所有游戏（从云端MongoDB）
-        all_games = await Game.find_all().to_list()
-        
-        if not all_games:
-            # 如果数据库中没有游戏，从Steam获取热门游戏
-            return await steam_service.get_top_games(limit)
-        
-        # 如果没有偏好或偏好为空，随机返回
-        if not prefs or not prefs.get("genre_weights"):
-            random.shuffle(all_games)
-            result = []
-            for game in all_games[:limit]:
-                game_dict = {
-                    "_id": str(game.id),
-                    "app_id": game.app_id,
-                    "name": game.name,
-                    "price": game.price,
-                    "genres": normalize_genres(game.genres),
-                    "description": game.description,
-                    "positive_reviews": game.positive_reviews,
-                    "negative_reviews": game.negative_reviews,
-                }
-                result.append(game_dict)
-            return result
-        
-        genre_weights = prefs["genre_weights"]
-        clicked_games = set(prefs.get("clicked_games", []))
-        
-        # 根据偏好权重计算每个游戏的得分
-        scored_games = []
-        for game in all_games:
-            # 规范化genres格式
-            genres = normalize_genres(game.genres)
-            
-            # 基础得分：偏好匹配
-            score = 0
-            for genre in genres:
-                score += genre_weights.get(genre, 0)
-            
-            # 添加较大的随机因子（增加多样性，避免总是推荐相同游戏）
-            # 随机因子范围：0-100%的基础得分，确保每次推荐都有显著变化
-            if score > 0:
-                random_factor = random.uniform(0, score)  # 0-100%随机波动
-            else:
-                random_factor = random.uniform(0, 5)  # 无偏好时给予基础随机分
-            score += random_factor
-            
-            # 降低已点击游戏的权重（但不完全排除）
-            if game.app_id in clicked_games:
-                score *= 0.7
-            
-            # 考虑评价数量（热门度）- 也添加随机波动
-            if game.positive_reviews:
-                popularity_score = min(game.positive_reviews / 10000, 1.0)  # 归一化到0-1
-                score += popularity_score * random.uniform(0.3, 0.8)  # 0.3-0.8随机权重
-            
-            scored_games.append({
-                "_id": str(game.id),
-                "app_id": game.app_id,
-                "name": game.name,
-                "price": game.price,
-                "genres": genres,
-                "description": game.description,
-                "positive_reviews": game.positive_reviews,
-                "negative_reviews": game.negative_reviews,
-                "score": score
-            })
-        
-        # 按得分排序（降序）
-        scored_games.sort(key=lambda x: x["score"], reverse=True)
-        
-        # 完全随机化策略：从所有游戏中随机选择，但高分游戏概率更高
-        # 为了增加多样性，我们使用加权随机而不是简单排序
-        
-        # 计算总分用于加权随机
-        total_score = sum(g["score"] for g in scored_games)
-        
-        if total_score > 0:
-            # 使用加权随机选择
-            recommended = []
-            available_games = scored_games.copy()
-            
-            for _ in range(min(limit, len(available_games))):
-                # 重新计算当前可用游戏的总分
-                current_total = sum(g["score"] for g in available_games)
-                if current_total == 0:
-                    # 如果分数都为0，完全随机选择
-                    selected = random.choice(available_games)
-                else:
-                    # 加权随机选择
-                    rand_val = random.uniform(0, current_total)
-                    cumulative = 0
-                    selected = available_games[0]
-                    for game in available_games:
-                        cumulative += game["score"]
-                        if cumulative >= rand_val:
-                            selected = game
-                            break
-                
-                recommended.append(selected)
-                available_games.remove(selected)
-        else:
-            # 完全随机选择
-            random.shuffle(scored_games)
-            recommended = scored_games[:limit]
+        prefs = await store.get_user_preference_async(user_id)
         
-        # 移除score字段并返回
-        result = []
-        for game in recommended[:limit]:
-            game.pop("score")
-            result.append(game)
+        # 相同偏好在短时间内重复请求（如刷新首页）直接返回缓存结果
+        cache_key = recommendation_cache.make_key(user_id, limit, prefs)
+        result = recommendation_cache.get(cache_key)
+        if result is None:
+            result = await compute_recommendations(prefs, limit)
+            recommendation_cache.set(cache_key, result)
         
         return result
         
@@ -448,7 +394,6 @@ async def get_recommendations(user_id: str = "default_user", limit: int = 10):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-
 @app.post("/preferences/click")
 async def record_game_click(app_id: int, user_id: str = "default_user"):
     """
@@ -460,42 +405,51 @@ async def record_game_click(app_id: int, user_id: str = "default_user"):
     }
     """
     try:
-        # 获取游戏信息（从云端MongoDB）
-        game = await Game.find_one(Game.app_id == app_id)
-        if not game:
-            # 如果数据库中没有，从Steam获取
-            game_data = await steam_service.get_game_details(app_id)
-            if not game_data:
-                raise HTTPException(status_code=404, detail="Game not found")
-            genres = game_data.get("genres", [])
-        else:
-            genres = game.genres
-        
         # 使用本地SQLite存储用户偏好
         store = get_preference_store()
         
-        # 获取现有偏好
-        prefs = store.get_user_preference(user_id)
-        if prefs is None:
-            prefs = {"genre_weights": {}, "clicked_games": []}
-        
-        # 更新类型权重（点击增加1分 - 表示浏览兴趣）
-        for genre in genres:
-            prefs["genre_weights"][genre] = prefs["genre_weights"].get(genre, 0) + 1
-        
-        # 添加点击的游戏
-        if app_id not in prefs["clicked_games"]:
-            prefs["clicked_games"].append(app_id)
+        # 获取游戏信息: 先发起云端MongoDB查询，同时检查本地SQLite游戏缓存
+        # 缓存命中时取消MongoDB查询，未命中时MongoDB的网络延迟已与本地查询重叠
+        mongo_task = asyncio.ensure_future(Game.find_one(Game.app_id == app_id))
+        need_mongo = False
+        try:
+            cached = await store.get_cached_game_async(app_id)
+            need_mongo = cached is None
+        finally:
+            # 缓存命中或本地查询失败时不再需要MongoDB结果, 取消任务避免其被遗留
+            if not need_mongo:
+                mongo_task.cancel()
+                # 已完成的任务无法取消: 取出其异常, 避免 "Task exception was never retrieved"
+                if mongo_task.done() and not mongo_task.cancelled():
+                    mongo_task.exception()
+        
+        if cached is not None:
+            genres = cached.get("genres", [])
+        else:
+            game = await mongo_task
+            if not game:
+                # 如果数据库中没有，从Steam获取
+                game_data = await steam_service.get_game_details(app_id)
+                if not game_data:
+                    raise HTTPException(status_code=404, detail="Game not found")
+                genres = game_data.get("genres", [])
+            else:
+                genres = game.genres
+            await store.cache_game_async(app_id, {"app_id": app_id, "genres": genres})
         
-        # 保存到本地SQLite
-        store.save_user_preference(user_id, prefs["genre_weights"], prefs["clicked_games"])
+        # 更新类型权重（点击增加1分 - 表示浏览兴趣）并记录点击的游戏
+        # 在SQLite中单个事务内原地UPSERT，返回本次涉及类型的最新权重
+        genre_weights = await store.record_click_async(user_id, app_id, genres)
+        recommendation_cache.invalidate_user(user_id)
         
         return {
             "message": "Preference updated (local storage)",
-            "genre_weights": prefs["genre_weights"],
+            "genre_weights": genre_weights,
             "storage": "local_sqlite"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Failed to record click: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -504,8 +458,8 @@ async def record_game_click(app_id: int, user_id: str = "default_user"):
 # ============================================
 # API路由 - NLP情感分析
 # ============================================
-@app.post("/analyze", response_model=SentimentResponse)
-async def analyze_sentiment(request: SentimentRequest):
+@app.post("/analyze")
+async def analyze_sentiment(request: Request):
     """
     NLP情感分析端点
     
@@ -523,55 +477,109 @@ async def analyze_sentiment(request: SentimentRequest):
     
     流程:
     1. 调用BERT模型进行情感推理
-    2. 存储分析结果到MongoDB (sentiment_logs集合)
+    2. 存储分析结果到MongoDB (sentiment_logs集合, 后台批量写入)
     3. 返回分析结果给前端
+    
+    请求/响应使用msgspec直接解码和编码 (绕过FastAPI的Pydantic校验与序列化)
     """
+    # Step 0: 解码并校验请求体
     try:
-        # Step 1: 调用NLP服务进行情感分析
-        result = predict_sentiment(request.text)
+        payload = msgspec.json.decode(await request.body(), type=SentimentRequest)
+    except (msgspec.ValidationError, msgspec.DecodeError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    
+    try:
+        # Step 1: 调用NLP服务进行情感分析 (与并发请求合并为批量推理)
+        result = await predict_sentiment_async(payload.text)
         
-        # Step 2: 存储到数据库
+        # Step 2: 存储到数据库（交给后台批量写入，不等待MongoDB往返）
         log = SentimentLog(
-            text=request.text,
+            text=payload.text,
             label=result["label"],
             confidence=result["confidence"],
-            related_game_id=request.related_game_id
+            related_game_id=payload.related_game_id
         )
-        await log.insert()
+        sentiment_log_writer.submit(log)
         
         # Step 3: 返回响应
-        return SentimentResponse(
+        response = SentimentResponse(
             label=result["label"],
             confidence=result["confidence"],
-            text=request.text,
+            text=payload.text,
             timestamp=log.created_at
         )
+        return Response(content=msgspec.json.encode(response), media_type="application/json")
         
     except Exception as e:
         logger.error(f"Sentiment analysis failed: {e}")
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
 
 
-@app.get("/history", response_model=List[SentimentLog])
-async def get_sentiment_history(skip: int = 0, limit: int = 50):
+async def stream_json_array(cursor, first_doc: Optional[dict] = None):
+    """
+    将Motor游标逐条编码为JSON数组流式输出
+    - 直接序列化原始BSON字典, 跳过Beanie/Pydantic的模型构造和二次序列化
+    - 内存中只保留当前一条文档
+    - first_doc: 调用方在返回响应前已从游标取出的第一条文档
+    
+    响应开始后状态码无法再改为500: 迭代出错时记录日志并重新抛出, 由服务器中断连接,
+    客户端收到不完整的响应, 而不是看似正常结束的截断数组
+    """
+    yield b"["
+    if first_doc is None:
+        yield b"]"
+        return
+    try:
+        first_doc["_id"] = str(first_doc["_id"])
+        yield orjson.dumps(first_doc)
+        async for doc in cursor:
+            doc["_id"] = str(doc["_id"])
+            yield b","
+            yield orjson.dumps(doc)
+    except Exception as e:
+        logger.error(f"Failed to stream results: {e}")
+        raise
+    yield b"]"
+
+
+@app.get("/history")
+async def get_sentiment_history(before_id: Optional[str] = None, before: Optional[datetime] = None,
+                                limit: int = 50):
     """
     获取情感分析历史记录 (按时间倒序)
     
     Query参数:
-    - skip: 跳过记录数
+    - before_id: 翻页游标, 传入上一页最后一条记录的_id, 返回比它更早的记录
+    - before: 只返回早于该时间的记录 (按_id中的秒级时间戳过滤)
     - limit: 返回数量 (默认50)
     
-    返回: SentimentLog列表
+    使用keyset分页: 按_id倒序 (ObjectId唯一且随写入时间递增), 借助_id索引直接定位, 翻页深度不影响查询开销;
+    批量写入的多条日志created_at可能相同 (BSON时间只精确到毫秒), 以_id为游标翻页不会漏掉同一时刻的记录
+    
+    返回: SentimentLog列表 (JSON数组流式响应, 下一页游标即最后一条的_id)
     """
     try:
-        logs = await SentimentLog.find_all()\
-            .sort(-SentimentLog.created_at)\
-            .skip(skip)\
-            .limit(limit)\
-            .to_list()
-        
-        return logs
+        # 两个条件都给出时取更早的上界
+        bounds = []
+        if before_id:
+            try:
+                bounds.append(ObjectId(before_id))
+            except InvalidId:
+                raise HTTPException(status_code=400, detail=f"Invalid before_id: {before_id}")
+        if before:
+            bounds.append(ObjectId.from_datetime(before))
+        query = {"_id": {"$lt": min(bounds)}} if bounds else {}
+        
+        cursor = SentimentLog.get_motor_collection().find(query)\
+            .sort("_id", DESCENDING)\
+            .limit(limit)
+        
+        # 返回响应前取出第一条 (同时取回第一批结果): 连接/查询错误仍在这里抛出并返回500
+        first_doc = await anext(cursor, None)
+        return StreamingResponse(stream_json_array(cursor, first_doc), media_type="application/json")
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Failed to fetch history: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -580,6 +588,22 @@ async def get_sentiment_history(skip: int = 0, limit: int = 50):
 # ============================================
 # API路由 - Wishlist管理
 # ============================================
+# 添加wishlist时只需要游戏名称和类型
+GAME_WISHLIST_PROJECTION = {"name": 1, "genres": 1}
+
+# wishlist列表返回的游戏字段（_id默认返回）
+GAME_WISHLIST_ITEM_PROJECTION = {
+    "app_id": 1,
+    "name": 1,
+    "price": 1,
+    "genres": 1,
+    "description": 1,
+    "release_date": 1,
+    "positive_reviews": 1,
+    "negative_reviews": 1,
+}
+
+
 @app.get("/wishlist")
 async def get_wishlist(user_id: str = "default_user"):
     """
@@ -591,28 +615,37 @@ async def get_wishlist(user_id: str = "default_user"):
     返回: 用户收藏的游戏详细信息列表
     """
     try:
-        # 获取或创建用户
-        user = await User.find_one(User.user_id == user_id)
+        # 获取或创建用户（只取favorite_games字段）
+        users_collection = User.get_motor_collection()
+        user = await users_collection.find_one({"user_id": user_id}, {"favorite_games": 1})
         if not user:
-            user = User(user_id=user_id, username=user_id, favorite_games=[])
-            await user.insert()
+            now = datetime.now(timezone.utc)
+            await users_collection.update_one(
+                {"user_id": user_id},
+                {"$setOnInsert": {
+                    "username": user_id, "favorite_games": [], "play_history": [],
+                    "created_at": now, "last_active": now,
+                }},
+                upsert=True
+            )
+            return []
         
         # 如果wishlist为空，返回空列表
-        if not user.favorite_games:
+        favorite_games = user.get("favorite_games")
+        if not favorite_games:
             return []
         
-        # 获取wishlist中游戏的详细信息
-        games = await Game.find({"app_id": {"$in": user.favorite_games}}).to_list()
+        # 一次$in查询获取wishlist中游戏的详细信息（原始dict，跳过Beanie模型构造）
+        games = await Game.get_motor_collection().find(
+            {"app_id": {"$in": favorite_games}}, GAME_WISHLIST_ITEM_PROJECTION
+        ).to_list(length=None)
         
-        # 规范化genres格式并添加_id字段
-        result = []
+        # genres已在写入时规范化（旧数据直接返回原列表，无额外开销），添加字符串_id字段
         for game in games:
-            game_dict = game.dict()
-            game_dict["genres"] = normalize_genres(game.genres)
-            game_dict["_id"] = str(game.id)
-            result.append(game_dict)
+            game["_id"] = str(game["_id"])
+            game["genres"] = normalize_genres(game.get("genres"))
         
-        return result
+        return games
         
     except Exception as e:
         logger.error(f"Failed to fetch wishlist: {e}")
@@ -636,8 +669,9 @@ async def add_to_wishlist(app_id: int, user_id: str = "default_user"):
     3. 添加app_id到用户的favorite_games列表
     """
     try:
-        # 检查游戏是否已在全局游戏库中
-        game = await Game.find_one(Game.app_id == app_id)
+        # 检查游戏是否已在全局游戏库中（只取后续需要的字段）
+        games_collection = Game.get_motor_collection()
+        game = await games_collection.find_one({"app_id": app_id}, GAME_WISHLIST_PROJECTION)
         
         if not game:
             # 从Steam获取游戏信息
@@ -645,45 +679,47 @@ async def add_to_wishlist(app_id: int, user_id: str = "default_user"):
             if not game_data:
                 raise HTTPException(status_code=404, detail=f"Game {app_id} not found on Steam")
             
-            # 保存到全局游戏库
-            game = Game(**game_data)
-            await game.insert()
-            logger.info(f"Added new game to library: {game.name}")
-        
-        # 获取或创建用户
-        user = await User.find_one(User.user_id == user_id)
-        if not user:
-            user = User(user_id=user_id, username=user_id, favorite_games=[])
-            await user.insert()
+            # 保存到全局游戏库：由MongoDB在服务端判断是否存在（$setOnInsert），并发添加同一游戏不会重复插入
+            new_game = Game(**game_data)
+            new_game.compute_derived_fields()  # 直接通过Motor写入不会触发Beanie的事件钩子
+            game = await games_collection.find_one_and_update(
+                {"app_id": app_id},
+                {"$setOnInsert": new_game.model_dump(exclude={"id", "revision_id"})},
+                projection=GAME_WISHLIST_PROJECTION,
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            game_index.invalidate()
+            logger.info(f"Added new game to library: {game['name']}")
+        
+        # 添加到wishlist：一次原子更新完成用户的获取或创建、去重追加和活跃时间更新
+        # 返回更新前的文档，用于判断用户是否新建、游戏是否已在wishlist中
+        now = datetime.now(timezone.utc)
+        user_before = await User.get_motor_collection().find_one_and_update(
+            {"user_id": user_id},
+            {
+                "$addToSet": {"favorite_games": app_id},
+                "$set": {"last_active": now},
+                "$setOnInsert": {"username": user_id, "play_history": [], "created_at": now},
+            },
+            projection={"favorite_games": 1},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE
+        )
         
         # 检查是否已在wishlist中
-        if app_id in user.favorite_games:
-            return {"message": "Game already in wishlist", "app_id": app_id, "name": game.name}
-        
-        # 添加到wishlist
-        user.favorite_games.append(app_id)
-        user.last_active = datetime.now(timezone.utc)
-        await user.save()
+        if user_before and app_id in user_before.get("favorite_games", []):
+            return {"message": "Game already in wishlist", "app_id": app_id, "name": game["name"]}
         
         # 更新用户偏好权重（加入愿望单增加5分 - 表示强烈兴趣）
         store = get_preference_store()
-        prefs = store.get_user_preference(user_id)
-        if prefs is None:
-            prefs = {"genre_weights": {}, "clicked_games": []}
-        
-        # 为游戏的每个类型增加5分权重
-        genres = normalize_genres(game.genres)
-        for genre in genres:
-            prefs["genre_weights"][genre] = prefs["genre_weights"].get(genre, 0) + 5
+        await store.update_genre_weights_async(user_id, normalize_genres(game.get("genres")), 5)
         
-        # 保存更新后的偏好
-        store.save_user_preference(user_id, prefs["genre_weights"], prefs["clicked_games"])
-        
-        logger.info(f"Added game {game.name} to {user_id}'s wishlist and updated preferences (+5 weight per genre)")
+        logger.info(f"Added game {game['name']} to {user_id}'s wishlist and updated preferences (+5 weight per genre)")
         return {
             "message": "Game added to wishlist",
             "app_id": app_id,
-            "name": game.name,
+            "name": game["name"],
             "preference_boost": "+5 per genre"
         }
         
@@ -708,38 +744,28 @@ async def remove_from_wishlist(app_id: int, user_id: str = "default_user"):
     注意: 只从用户wishlist中移除，不会删除全局游戏库中的游戏
     """
     try:
-        # 获取用户
-        user = await User.find_one(User.user_id == user_id)
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        # 检查游戏是否在wishlist中
-        if app_id not in user.favorite_games:
+        # 从 wishlist 中移除：只匹配wishlist中包含该游戏的用户，一次原子更新完成检查和移除
+        users_collection = User.get_motor_collection()
+        removed = await users_collection.find_one_and_update(
+            {"user_id": user_id, "favorite_games": app_id},
+            {"$pull": {"favorite_games": app_id}, "$set": {"last_active": datetime.now(timezone.utc)}},
+            projection={"_id": 1}
+        )
+        if removed is None:
+            # 区分用户不存在和游戏不在wishlist中
+            if not await users_collection.find_one({"user_id": user_id}, {"_id": 1}):
+                raise HTTPException(status_code=404, detail="User not found")
             raise HTTPException(status_code=404, detail="Game not in wishlist")
         
         # 获取游戏信息以获取genres
-        game = await Game.find_one(Game.app_id == app_id)
-        
-        # 从 wishlist 中移除
-        user.favorite_games.remove(app_id)
-        user.last_active = datetime.now(timezone.utc)
-        await user.save()
+        game = await Game.get_motor_collection().find_one({"app_id": app_id}, {"genres": 1})
         
         # 减少用户偏好权重（从愿望单移除减少5分）
         if game:
             store = get_preference_store()
-            prefs = store.get_user_preference(user_id)
-            if prefs is not None:
-                # 为游戏的每个类型减少5分权重
-                genres = normalize_genres(game.genres)
-                for genre in genres:
-                    current_weight = prefs["genre_weights"].get(genre, 0)
-                    # 减少5分，但不低于0
-                    prefs["genre_weights"][genre] = max(0, current_weight - 5)
-                
-                # 保存更新后的偏好
-                store.save_user_preference(user_id, prefs["genre_weights"], prefs["clicked_games"])
-                logger.info(f"Removed game {app_id} from {user_id}'s wishlist and decreased preferences (-5 weight per genre)")
+            # 为游戏的每个类型减少5分权重（store内部保证不低于0）
+            await store.update_genre_weights_async(user_id, normalize_genres(game.get("genres")), -5)
+            logger.info(f"Removed game {app_id} from {user_id}'s wishlist and decreased preferences (-5 weight per genre)")
         
         return {"message": "Game removed from wishlist", "app_id": app_id}
         
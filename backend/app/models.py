@@ -3,10 +3,85 @@ Beanie Document Models (MongoDB ODM)
 数据模型定义 - 使用Beanie ODM定义MongoDB集合的Schema
 包含三个核心模型: Game, User, SentimentLog
 """
+import re
 from datetime import datetime, timezone
-from typing import Optional, List
-from beanie import Document
+from functools import lru_cache
+from typing import Annotated, Optional, List, Tuple
+import msgspec
+from beanie import Document, Insert, Replace, Save, before_event
 from pydantic import BaseModel, Field
+from pymongo import ASCENDING, IndexModel
+
+
+# ============================================
+# 辅助函数
+# ============================================
+# 逗号分隔的genres字符串 (兼容 "Action, Adventure" 和 "Action,Adventure")
+_GENRE_SEPARATOR = re.compile(r"\s*,\s*")
+
+
+@lru_cache(maxsize=8192)
+def _split_genres(text: str) -> Tuple[str, ...]:
+    """分割逗号分隔的genres字符串 (结果缓存, 同样的类型组合会反复出现)"""
+    return tuple(g for g in _GENRE_SEPARATOR.split(text.strip()) if g)
+
+
+def normalize_genres(genres):
+    """
+    规范化genres格式，确保返回正确的字符串数组
+    
+    处理以下情况:
+    - genres是字符串: "Action, Adventure" -> ["Action", "Adventure"]
+    - genres是包含单个逗号分隔字符串的数组: ["Action, Adventure"] -> ["Action", "Adventure"]
+    - genres已经是正确的数组: ["Action", "Adventure"] -> ["Action", "Adventure"]
+    
+    Game在写入MongoDB前会调用此函数, 读路径上的数据已是规范格式
+    """
+    if not genres:
+        return []
+    
+    # 如果是字符串，直接分割
+    if isinstance(genres, str):
+        return list(_split_genres(genres))
+    
+    # 如果是数组
+    if isinstance(genres, list):
+        # 检查是否是单个元素且包含逗号（需要分割的情况）
+        if len(genres) == 1 and isinstance(genres[0], str) and "," in genres[0]:
+            return list(_split_genres(genres[0]))
+        # 已经是正确的数组格式 (直接返回, 不做复制)
+        return genres
+    
+    return []
+
+
+# Steam商店的固定类型词表 {genre: bit位}, 用于Game.genre_bitmask
+# 注意: 顺序即bit位, 已写入的数据依赖此顺序, 新类型只能追加到末尾 (最多63个, 保证掩码可存为BSON int64)
+GENRE_VOCAB = {genre: bit for bit, genre in enumerate([
+    "Action", "Adventure", "Casual", "Indie", "Massively Multiplayer", "Racing", "RPG",
+    "Simulation", "Sports", "Strategy", "Free to Play", "Early Access", "Violent", "Gore",
+    "Nudity", "Sexual Content", "Education", "Utilities", "Design & Illustration",
+    "Animation & Modeling", "Video Production", "Photo Editing", "Audio Production",
+    "Software Training", "Web Publishing", "Accounting", "Game Development",
+])}
+
+# 正面评价数达到该值时热门度记为1.0
+POPULARITY_SATURATION = 10000
+
+
+def compute_popularity(positive_reviews: Optional[int]) -> float:
+    """由正面评价数计算归一化热门度 (0-1)"""
+    return min((positive_reviews or 0) / POPULARITY_SATURATION, 1.0)
+
+
+def compute_genre_bitmask(genres: List[str]) -> int:
+    """将规范化后的genres映射为GENRE_VOCAB位掩码 (词表外的类型忽略)"""
+    bitmask = 0
+    for genre in genres:
+        bit = GENRE_VOCAB.get(genre)
+        if bit is not None:
+            bitmask |= 1 << bit
+    return bitmask
 
 
 # ============================================
@@ -26,9 +101,26 @@ class Game(Document):
     positive_reviews: Optional[int] = Field(None, description="正面评价数")
     negative_reviews: Optional[int] = Field(None, description="负面评价数")
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    # 写入时计算的派生字段 (推荐打分直接使用, 无需在请求中重复计算)
+    popularity: float = Field(0.0, description="热门度 (0-1, 由正面评价数归一化)")
+    genre_bitmask: int = Field(0, description="GENRE_VOCAB类型位掩码")
+    
+    @before_event(Insert, Replace, Save)
+    def compute_derived_fields(self):
+        """写入前规范化genres并计算派生字段, 使读路径无需再逐条处理"""
+        self.genres = normalize_genres(self.genres)
+        self.popularity = compute_popularity(self.positive_reviews)
+        self.genre_bitmask = compute_genre_bitmask(self.genres)
     
     class Settings:
         name = "games"  # MongoDB集合名称
+        indexes = [
+            # 点击/wishlist/推荐回退都按app_id查询; 唯一约束同时防止并发写入产生重复游戏
+            # 注意: 已有数据库 (旧版爬虫建过非唯一的app_id_1, 或存在重复app_id) 需先运行
+            # migrate_indexes.py 去重并重建索引, 否则init_beanie创建索引会失败
+            IndexModel([("app_id", ASCENDING)], unique=True),
+        ]
+
 
 
 # ============================================
@@ -48,6 +140,12 @@ class User(Document):
     
     class Settings:
         name = "users"
+        indexes = [
+            # 唯一约束保证wishlist的upsert在并发下不会创建重复用户
+            IndexModel([("user_id", ASCENDING)], unique=True),
+            # wishlist的$addToSet/$pull按 {user_id, favorite_games} 过滤 (多键索引)
+            IndexModel([("user_id", ASCENDING), ("favorite_games", ASCENDING)]),
+        ]
 
 
 # ============================================
@@ -94,21 +192,22 @@ class SentimentLog(Document):
     related_game_id: Optional[int] = Field(None, description="关联的游戏App ID (可选)")
     
     class Settings:
-        name = "sentiment_logs"
+        name = "sentiment_logs"  # /history 按_id倒序分页, 使用默认的_id索引
 
 
 # ============================================
-# Pydantic Request/Response Models
+# msgspec Request/Response Models (/analyze热路径)
 # ============================================
-class SentimentRequest(BaseModel):
+# 使用msgspec.Struct代替Pydantic: 解码+校验+编码在C扩展中完成, 开销远低于Pydantic
+class SentimentRequest(msgspec.Struct):
     """情感分析请求模型"""
-    text: str = Field(..., min_length=1, max_length=5000, description="待分析的文本(1-5000字符)")
-    related_game_id: Optional[int] = Field(None, description="可选: 关联的游戏ID")
+    text: Annotated[str, msgspec.Meta(min_length=1, max_length=5000, description="待分析的文本(1-5000字符)")]
+    related_game_id: Optional[int] = None  # 可选: 关联的游戏ID
 
 
-class SentimentResponse(BaseModel):
+class SentimentResponse(msgspec.Struct):
     """情感分析响应模型"""
-    label: str = Field(..., description="情感标签")
-    confidence: float = Field(..., description="置信度")
-    text: str = Field(..., description="原始文本")
-    timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), description="分析时间")
+    label: str       # 情感标签
+    confidence: float  # 置信度
+    text: str        # 原始文本
+    timestamp: datetime = msgspec.field(default_factory=lambda: datetime.now(timezone.utc))  # 分析时间
@@ -3,23 +3,55 @@ NLP Sentiment Analysis Service
 NLP情感分析服务 - 使用BERT模型进行文本情感分类
 
 核心功能:
-1. 加载 HuggingFace 预训练BERT模型 (distilbert-base-uncased-finetuned-sst-2-english)
+1. 加载 HuggingFace 在SST-2上蒸馏的小型BERT模型 (默认 philschmid/tiny-bert-sst2-distilled, 可通过SENTIMENT_MODEL切换)
 2. 提供 predict_sentiment() 函数进行情感推理
 3. 使用单例模式避免重复加载模型 (节省内存和启动时间)
+4. 若存在INT8量化的ONNX模型 (export_onnx_model.py导出), 优先使用ONNX Runtime推理
 
 资源管理:
-- 模型大小: ~250MB
-- 内存占用: ~500MB (推理时)
+- 模型大小: 远小于DistilBERT (~250MB), 推理耗时与层数成正比
+- 内存占用: DistilBERT推理时约500MB, 默认小模型显著更低
 - 建议Kubernetes资源限制: 1.5-2GB RAM
+- ONNX INT8模型权重约为FP32的1/4, 多worker部署时每个进程的内存占用显著降低
 """
-from transformers import pipeline
-from typing import Dict
+from typing import Dict, List, Optional, Tuple
+import asyncio
 import logging
+import os
+
+# 推理线程数 (PyTorch与ONNX Runtime共用; 默认使用全部CPU核心, 多worker部署时建议设为 核心数/worker数)
+# OpenMP/MKL在torch导入时读取环境变量, 因此必须在导入transformers/torch之前设置
+SENTIMENT_INTRA_OP_THREADS = int(os.getenv("SENTIMENT_INTRA_OP_THREADS", str(os.cpu_count() or 1)))
+os.environ.setdefault("OMP_NUM_THREADS", str(SENTIMENT_INTRA_OP_THREADS))
+os.environ.setdefault("MKL_NUM_THREADS", str(SENTIMENT_INTRA_OP_THREADS))
+
+from transformers import AutoConfig, AutoModelForSequenceClassification, AutoTokenizer
+import numpy as np
+import torch
+
+try:
+    import onnxruntime as ort
+except ImportError:  # 未安装onnxruntime时回退到PyTorch模型
+    ort = None
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 情感分析模型 (设为 distilbert-base-uncased-finetuned-sst-2-english 可换回精度更高的DistilBERT)
+MODEL_NAME = os.getenv("SENTIMENT_MODEL", "philschmid/tiny-bert-sst2-distilled")
+# export_onnx_model.py 的输出目录 (包含model.int8.onnx, tokenizer和config)
+SENTIMENT_ONNX_DIR = os.getenv("SENTIMENT_ONNX_DIR", "/app/models/sentiment-onnx")
+SENTIMENT_ONNX_MODEL = os.path.join(SENTIMENT_ONNX_DIR, "model.int8.onnx")
+# PyTorch后端是否使用TorchScript (trace + freeze + optimize_for_inference)
+SENTIMENT_TORCHSCRIPT = os.getenv("SENTIMENT_TORCHSCRIPT", "1") == "1"
+# 模型forward的位置参数顺序; BERT需要token_type_ids, DistilBERT的tokenizer不返回该字段
+MODEL_INPUT_NAMES = ("input_ids", "attention_mask", "token_type_ids")
+
+# 算子内并行使用SENTIMENT_INTRA_OP_THREADS; 单请求推理没有算子间并行可用, 设为1避免线程争用
+torch.set_num_threads(SENTIMENT_INTRA_OP_THREADS)
+torch.set_num_interop_threads(1)
+
 
 class SentimentAnalyzer:
     """
@@ -28,7 +60,12 @@ class SentimentAnalyzer:
     - 后续调用复用已加载的模型
     """
     _instance = None
-    _model = None
+    _model = None  # PyTorch模型
+    # ONNX Runtime后端 (可用时替代PyTorch模型)
+    _session = None
+    # 两种后端共用tokenizer和标签映射
+    _tokenizer = None
+    _id2label = None
     
     def __new__(cls):
         """单例模式 - 确保只创建一个实例"""
@@ -38,39 +75,135 @@ class SentimentAnalyzer:
     
     def __init__(self):
         """初始化模型 (仅在首次创建时执行)"""
-        if self._model is None:
+        if self._model is None and self._session is None:
             self._load_model()
     
     def _load_model(self):
         """
         加载BERT情感分析模型
         
-        模型选择: distilbert-base-uncased-finetuned-sst-2-english
-        - 优点: 轻量级 (66M参数 vs BERT的110M)
+        模型选择: philschmid/tiny-bert-sst2-distilled (默认)
+        - 优点: 由SST-2上的BERT蒸馏得到, 层数和隐藏维度都小于DistilBERT (66M参数), 推理更快
         - 训练数据: Stanford Sentiment Treebank (SST-2)
-        - 输出: POSITIVE / NEGATIVE (二分类)
+        - 输出: POSITIVE / NEGATIVE (二分类, 标签统一转为大写)
         
         注意: 首次运行时会从HuggingFace Hub下载模型缓存到 ~/.cache/huggingface/
         在Docker镜像中建议预下载模型以加速启动
         """
+        if self._load_onnx_model():
+            return
+
         try:
             logger.info("Loading BERT sentiment analysis model...")
             
-            # 使用HuggingFace pipeline简化推理流程
-            # task="sentiment-analysis" 会自动处理tokenization和post-processing
-            self._model = pipeline(
-                "sentiment-analysis",
-                model="distilbert-base-uncased-finetuned-sst-2-english",
-                device=-1  # -1表示使用CPU (在K8s中GPU支持需额外配置)
-            )
+            # 直接使用tokenizer + 模型 (而不是pipeline), 由tokenizer按token数截断输入
+            # torchscript=True: 模型返回tuple而非ModelOutput, 便于jit.trace
+            self._tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+            model = AutoModelForSequenceClassification.from_pretrained(MODEL_NAME, torchscript=True).eval()  # CPU推理
+            self._id2label = self._normalize_labels(model.config.id2label)
+            self._model = self._trace_model(model) if SENTIMENT_TORCHSCRIPT else model
             
             logger.info("Model loaded successfully!")
-            logger.info(f"Model: {self._model.model.config._name_or_path}")
+            logger.info(f"Model: {model.config._name_or_path}")
             
         except Exception as e:
             logger.error(f"Failed to load model: {e}")
             raise RuntimeError(f"Model loading failed: {e}")
     
+    @staticmethod
+    def _normalize_labels(id2label: Dict) -> Dict[int, str]:
+        """不同模型的标签大小写不一致 (如 negative/positive), 统一为 NEGATIVE/POSITIVE"""
+        return {int(label_id): label.upper() for label_id, label in id2label.items()}
+    
+    def _trace_model(self, model):
+        """
+        将模型转换为冻结的TorchScript图
+        - freeze把权重内联为常量, optimize_for_inference进一步做算子融合 (oneDNN)
+        - trace失败时回退到eager模式
+        """
+        try:
+            dummy = self._encode(["Test sentence for model tracing"], return_tensors="pt")
+            with torch.inference_mode():
+                traced = torch.jit.trace(model, self._model_args(dummy), strict=False)
+                traced = torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+            logger.info("TorchScript model ready")
+            return traced
+        except Exception as e:
+            logger.warning(f"TorchScript tracing failed, using eager model: {e}")
+            return model
+    
+    def _load_onnx_model(self) -> bool:
+        """
+        加载INT8量化的ONNX模型
+        
+        Returns:
+            bool: 加载成功返回True; 未安装onnxruntime或模型文件不存在时返回False
+        """
+        if ort is None or not os.path.exists(SENTIMENT_ONNX_MODEL):
+            return False
+        
+        try:
+            logger.info(f"Loading INT8 ONNX sentiment model: {SENTIMENT_ONNX_MODEL}")
+            # 开启全部图优化 (LayerNorm / GELU / Attention 等算子融合)
+            sess_options = ort.SessionOptions()
+            sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            sess_options.intra_op_num_threads = SENTIMENT_INTRA_OP_THREADS
+            self._session = ort.InferenceSession(
+                SENTIMENT_ONNX_MODEL,
+                sess_options=sess_options,
+                providers=["CPUExecutionProvider"]
+            )
+            self._tokenizer = AutoTokenizer.from_pretrained(SENTIMENT_ONNX_DIR)
+            self._id2label = self._normalize_labels(AutoConfig.from_pretrained(SENTIMENT_ONNX_DIR).id2label)
+            logger.info("ONNX model loaded successfully!")
+            return True
+        except Exception as e:
+            # ONNX模型损坏等情况下回退到PyTorch模型, 不影响服务启动
+            logger.warning(f"Failed to load ONNX model, falling back to PyTorch: {e}")
+            self._session = None
+            self._tokenizer = None
+            self._id2label = None
+            return False
+    
+    def _encode(self, texts: List[str], return_tensors: str):
+        """分词: 按token数截断到512, 并padding到批内最长样本 (调用方按长度排序后可减少填充)"""
+        return self._tokenizer(
+            texts, padding="longest", truncation=True, max_length=512, return_tensors=return_tensors
+        )
+    
+    def _decode(self, logits: np.ndarray) -> List[Dict[str, any]]:
+        """softmax后取概率最大的标签, 输出 {"label", "score"}"""
+        probs = np.exp(logits - logits.max(axis=-1, keepdims=True))
+        probs /= probs.sum(axis=-1, keepdims=True)
+        label_ids = probs.argmax(axis=-1)
+        return [
+            {"label": self._id2label[int(label_id)], "score": float(row[label_id])}
+            for row, label_id in zip(probs, label_ids)
+        ]
+    
+    @staticmethod
+    def _model_args(encoded) -> Tuple:
+        """按forward参数顺序取出tokenizer返回的输入 (token_type_ids仅在tokenizer返回时传入)"""
+        return tuple(encoded[name] for name in MODEL_INPUT_NAMES if name in encoded)
+    
+    def _predict_onnx(self, texts: List[str]) -> List[Dict[str, any]]:
+        """使用ONNX Runtime执行批量推理"""
+        encoded = self._encode(texts, return_tensors="np")
+        # 按导出模型声明的输入构建feed (BERT导出后还需要token_type_ids)
+        feed = {
+            model_input.name: encoded[model_input.name].astype(np.int64)
+            for model_input in self._session.get_inputs()
+        }
+        logits = self._session.run(None, feed)[0]
+        return self._decode(logits)
+    
+    def _predict_torch(self, texts: List[str]) -> List[Dict[str, any]]:
+        """使用PyTorch模型执行批量推理"""
+        encoded = self._encode(texts, return_tensors="pt")
+        with torch.inference_mode():
+            logits = self._model(*self._model_args(encoded))[0]
+        return self._decode(logits.numpy())
+    
     def predict(self, text: str) -> Dict[str, any]:
         """
         执行情感预测
@@ -90,18 +223,36 @@ class SentimentAnalyzer:
             >>> print(result)
             {'label': 'POSITIVE', 'score': 0.9998}
         """
-        if self._model is None:
+        return self.predict_batch([text])[0]
+    
+    def predict_batch(self, texts: List[str]) -> List[Dict[str, any]]:
+        """
+        批量执行情感预测 (一次前向计算处理多条文本)
+        
+        Args:
+            texts (List[str]): 待分析的文本列表
+        
+        Returns:
+            List[Dict]: 与texts顺序一致的 {"label", "confidence"} 列表
+        """
+        if self._model is None and self._session is None:
             raise RuntimeError("Model not initialized")
         
         try:
             # 执行推理
-            # pipeline会自动处理: tokenization -> model forward -> softmax -> argmax
-            result = self._model(text[:512])[0]  # 限制最大长度512 tokens
+            # tokenization (超过512 tokens截断) -> model forward -> softmax -> argmax
+            if self._session is not None:
+                results = self._predict_onnx(texts)
+            else:
+                results = self._predict_torch(texts)
             
-            return {
-                "label": result["label"],      # POSITIVE 或 NEGATIVE
-                "confidence": result["score"]  # 置信度分数
-            }
+            return [
+                {
+                    "label": result["label"],      # POSITIVE 或 NEGATIVE
+                    "confidence": result["score"]  # 置信度分数
+                }
+                for result in results
+            ]
             
         except Exception as e:
             logger.error(f"Prediction failed: {e}")
@@ -134,6 +285,121 @@ def predict_sentiment(text: str) -> Dict[str, any]:
     return sentiment_analyzer.predict(text)
 
 
+# ============================================
+# 微批处理 - 合并并发请求为一次批量推理
+# ============================================
+SENTIMENT_BATCH_MAX = int(os.getenv("SENTIMENT_BATCH_MAX", "16"))
+SENTIMENT_BATCH_WINDOW_MS = float(os.getenv("SENTIMENT_BATCH_WINDOW_MS", "10"))
+
+
+class SentimentBatcher:
+    """
+    情感分析微批处理器
+    - 请求把 (text, future) 放入队列后等待结果
+    - 后台任务在短时间窗口内收集最多SENTIMENT_BATCH_MAX条文本, 合并为一次predict_batch
+    - 推理在线程池中执行, 不阻塞事件循环; 推理期间到达的请求自然组成下一批
+    """
+
+    def __init__(self, analyzer: SentimentAnalyzer,
+                 max_batch: int = SENTIMENT_BATCH_MAX,
+                 window_ms: float = SENTIMENT_BATCH_WINDOW_MS):
+        self._analyzer = analyzer
+        self._max_batch = max_batch
+        self._window = window_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        # 已从队列取出、正在收集或推理中的批次 (停止时需要一并结束)
+        self._batch: List[Tuple[str, asyncio.Future]] = []
+
+    def start(self):
+        """启动后台批处理任务 (需在事件循环中调用)"""
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止后台任务, 未处理的请求 (包括推理中的批次) 以异常结束"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        pending = self._batch
+        self._batch = []
+        while not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        for _, future in pending:
+            if not future.done():
+                future.set_exception(RuntimeError("Sentiment batcher stopped"))
+
+    async def submit(self, text: str) -> Dict[str, any]:
+        """提交一条文本并等待所在批次的推理结果"""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((text, future))
+        return await future
+
+    async def _collect_batch(self) -> List[Tuple[str, asyncio.Future]]:
+        """阻塞到第一条请求到达, 再在时间窗口内尽量凑满一批"""
+        loop = asyncio.get_running_loop()
+        # 直接收集到self._batch中, 收集期间被取消时已取出的请求不会丢失
+        batch = self._batch = [await self._queue.get()]
+        deadline = loop.time() + self._window
+
+        while len(batch) < self._max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect_batch()
+            # 按长度排序, 减少批内padding
+            batch.sort(key=lambda item: len(item[0]))
+            texts = [text for text, _ in batch]
+
+            try:
+                results = await asyncio.to_thread(self._analyzer.predict_batch, texts)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                self._batch = []
+                continue
+
+            for (_, future), result in zip(batch, results):
+                # 请求方可能已取消 (客户端断开)
+                if not future.done():
+                    future.set_result(result)
+            self._batch = []
+
+
+# 全局批处理器实例 (在应用lifespan中启动和停止)
+sentiment_batcher = SentimentBatcher(sentiment_analyzer)
+
+
+async def predict_sentiment_async(text: str) -> Dict[str, any]:
+    """
+    异步情感分析 - 经由微批处理器与其他并发请求合并推理
+    
+    Returns:
+        Dict: {"label": str, "confidence": float}
+    
+    Raises:
+        RuntimeError: 模型未加载或推理失败
+    """
+    return await sentiment_batcher.submit(text)
+
+
 # ============================================
 # 模型预热 (可选)
 # ============================================
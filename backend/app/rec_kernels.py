@@ -0,0 +1,84 @@
+"""
+Recommendation Kernels
+推荐打分的数值内核 - 不放回加权抽样 (Gumbel-top-k)
+
+实现:
+1. 安装了Numba时使用@njit编译的单遍内核: 逐个计算Gumbel键并维护长度为k的有序候选,
+   不分配N长度的临时数组 (log / gumbel / argpartition 各一遍)
+2. 未安装Numba时使用NumPy向量化实现, 结果分布完全相同
+
+应用启动时调用 warmup_kernels() 预先完成JIT编译, 避免首个请求承担编译耗时
+"""
+from typing import List
+import logging
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # 未安装numba时使用NumPy实现
+    njit = None
+
+logger = logging.getLogger(__name__)
+
+# 得分为0时的下限, 保证log有限且0分游戏之间仍随机排序
+MIN_SCORE = 1e-300
+
+
+def _gumbel_top_k_numpy(scores: np.ndarray, uniforms: np.ndarray, k: int) -> np.ndarray:
+    """NumPy实现: 整体计算Gumbel键后用argpartition取前k个"""
+    keys = np.log(np.maximum(scores, MIN_SCORE)) - np.log(-np.log(uniforms))
+    selected = np.argpartition(keys, -k)[-k:]
+    return selected[np.argsort(-keys[selected])]
+
+
+if njit is not None:
+    @njit(cache=True)
+    def _gumbel_top_k_numba(scores, uniforms, k):
+        """Numba实现: 单遍扫描, 插入排序维护键值最大的k个下标 (降序)"""
+        top_keys = np.full(k, -np.inf)
+        top_idx = np.full(k, -1, dtype=np.int64)
+        for i in range(scores.shape[0]):
+            score = scores[i] if scores[i] > MIN_SCORE else MIN_SCORE
+            key = np.log(score) - np.log(-np.log(uniforms[i]))
+            if key > top_keys[k - 1]:
+                j = k - 1
+                while j > 0 and top_keys[j - 1] < key:
+                    top_keys[j] = top_keys[j - 1]
+                    top_idx[j] = top_idx[j - 1]
+                    j -= 1
+                top_keys[j] = key
+                top_idx[j] = i
+        return top_idx
+
+    _gumbel_top_k = _gumbel_top_k_numba
+else:
+    _gumbel_top_k = _gumbel_top_k_numpy
+
+
+def gumbel_top_k(scores: np.ndarray, k: int, rng: np.random.Generator) -> List[int]:
+    """
+    按得分比例做k次不放回加权抽样
+
+    对 log(得分) 加Gumbel噪声后取前k个, 等价于逐个按比例抽样; 结果顺序即抽中顺序
+
+    Args:
+        scores: 非负得分数组
+        k: 抽样数量 (1 <= k <= len(scores))
+        rng: 随机数生成器
+
+    Returns:
+        List[int]: 选中的下标
+    """
+    # 1 - random() 的取值范围为 (0, 1], 避免log(0)
+    uniforms = 1.0 - rng.random(scores.shape[0])
+    return _gumbel_top_k(np.ascontiguousarray(scores, dtype=np.float64), uniforms, k).tolist()
+
+
+def warmup_kernels():
+    """预先编译Numba内核 (未安装Numba时无操作)"""
+    if njit is None:
+        logger.info("Numba not installed, using NumPy recommendation kernels")
+        return
+    gumbel_top_k(np.ones(16), 4, np.random.default_rng())
+    logger.info("Numba recommendation kernels compiled")
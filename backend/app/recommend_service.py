@@ -0,0 +1,205 @@
+"""
+Game Recommendation Index
+推荐索引服务 - 在内存中缓存游戏目录的类型矩阵, 用向量化运算计算偏好得分
+
+核心数据结构:
+1. genre_to_idx: 全局类型词表 {genre: 列号}
+2. genre_matrix: scipy CSC稀疏矩阵 (n_games × n_genres), 游戏包含该类型则为1
+   按列存储即倒排索引: 每个类型列就是包含该类型的游戏下标列表 (genre -> game rows)
+3. games: 推荐接口返回的游戏字典 (与矩阵行一一对应)
+4. app_ids / popularity: 与games对齐的NumPy数组, 供点击降权和热门度的向量化计算
+
+偏好得分只遍历用户有权重的类型列, 工作量为这些类型匹配的游戏数之和, 而不是全部游戏
+
+索引在游戏目录变化时失效, 另外每GAME_INDEX_TTL秒过期一次 (爬虫/导入脚本直接写MongoDB, 不经过API)
+
+另外提供 RecommendationCache: 短时间内相同偏好的推荐请求直接返回缓存结果
+"""
+from typing import Dict, Hashable, List, Optional
+import asyncio
+import logging
+import os
+import time
+
+import numpy as np
+from cachetools import TTLCache
+from scipy.sparse import csc_matrix
+
+from app.models import Game, compute_popularity, normalize_genres
+
+logger = logging.getLogger(__name__)
+
+# 推荐打分使用的随机数生成器 (进程内复用同一个PRNG状态)
+rng = np.random.default_rng()
+
+# 构建索引时只从MongoDB取回推荐需要的字段 (_id默认返回)
+GAME_INDEX_PROJECTION = {
+    "app_id": 1,
+    "name": 1,
+    "price": 1,
+    "genres": 1,
+    "description": 1,
+    "positive_reviews": 1,
+    "negative_reviews": 1,
+    "popularity": 1,
+}
+
+# 游戏索引过期时间 (秒)
+GAME_INDEX_TTL = int(os.getenv("GAME_INDEX_TTL", "300"))
+
+# 推荐结果缓存配置
+RECOMMENDATION_CACHE_SIZE = int(os.getenv("RECOMMENDATION_CACHE_SIZE", "1024"))
+RECOMMENDATION_CACHE_TTL = int(os.getenv("RECOMMENDATION_CACHE_TTL", "60"))  # 秒
+
+
+class RecommendationCache:
+    """
+    推荐结果的进程内TTL缓存
+    
+    键为 (user_id, limit, 类型权重快照), 偏好变化后自然产生新键;
+    点击会改变已点击游戏集合, 因此由调用方在点击后按用户失效
+    """
+
+    def __init__(self, maxsize: int = RECOMMENDATION_CACHE_SIZE, ttl: int = RECOMMENDATION_CACHE_TTL):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    @staticmethod
+    def make_key(user_id: str, limit: int, prefs: Optional[Dict]) -> Hashable:
+        """根据用户偏好快照生成缓存键"""
+        weights = tuple(sorted(prefs["genre_weights"].items())) if prefs else ()
+        return (user_id, limit, weights)
+
+    def get(self, key: Hashable) -> Optional[List[Dict]]:
+        return self._cache.get(key)
+
+    def set(self, key: Hashable, result: List[Dict]):
+        self._cache[key] = result
+
+    def invalidate_user(self, user_id: str):
+        """删除某个用户的全部缓存结果"""
+        for key in [key for key in self._cache.keys() if key[0] == user_id]:
+            self._cache.pop(key, None)
+
+    def clear(self):
+        self._cache.clear()
+
+
+# 全局推荐结果缓存实例
+recommendation_cache = RecommendationCache()
+
+
+class GameIndex:
+    """推荐用的内存游戏索引 (启动时构建, 游戏目录变化或TTL过期后按需重建)"""
+
+    def __init__(self):
+        self.genre_to_idx: Dict[str, int] = {}
+        self.genre_matrix: Optional[csc_matrix] = None
+        self.games: List[Dict] = []
+        self.app_ids: np.ndarray = np.empty(0, dtype=np.int64)
+        self.popularity: np.ndarray = np.empty(0, dtype=np.float64)
+        self._stale = True
+        self._expires_at = 0.0
+        # 每次invalidate递增, 用于发现重建期间发生的失效
+        self._generation = 0
+        # 避免并发请求同时重建 (thundering herd)
+        self._lock = asyncio.Lock()
+
+    @property
+    def size(self) -> int:
+        """索引中的游戏数量"""
+        return len(self.games)
+
+    async def refresh(self):
+        """从MongoDB加载游戏目录并重建类型矩阵"""
+        generation = self._generation
+        genre_to_idx: Dict[str, int] = {}
+        games: List[Dict] = []
+        popularity: List[float] = []
+        rows: List[int] = []
+        cols: List[int] = []
+
+        # 直接遍历Motor游标拿到原始dict, 跳过Beanie/Pydantic的逐文档校验
+        cursor = Game.get_motor_collection().find({}, GAME_INDEX_PROJECTION)
+        row = 0
+        async for doc in cursor:
+            genres = normalize_genres(doc.get("genres"))
+            for genre in genres:
+                rows.append(row)
+                cols.append(genre_to_idx.setdefault(genre, len(genre_to_idx)))
+            games.append({
+                "_id": str(doc["_id"]),
+                "app_id": doc["app_id"],
+                "name": doc["name"],
+                "price": doc.get("price"),
+                "genres": genres,
+                "description": doc.get("description"),
+                "positive_reviews": doc.get("positive_reviews"),
+                "negative_reviews": doc.get("negative_reviews"),
+            })
+            # 旧数据没有写入时计算的popularity字段, 在这里补算
+            popularity.append(
+                doc["popularity"] if "popularity" in doc else compute_popularity(doc.get("positive_reviews"))
+            )
+            row += 1
+
+        # 同一游戏重复出现的类型会在构造矩阵时累加, 与逐个类型累加权重的语义一致
+        genre_matrix = csc_matrix(
+            (np.ones(len(rows), dtype=np.float64), (rows, cols)),
+            shape=(len(games), len(genre_to_idx))
+        )
+        genre_matrix.sum_duplicates()
+        self.genre_matrix = genre_matrix
+        self.genre_to_idx = genre_to_idx
+        self.games = games
+        self.app_ids = np.array([game["app_id"] for game in games], dtype=np.int64)
+        self.popularity = np.array(popularity, dtype=np.float64)
+        # 重建期间有新的失效时保持stale, 下次使用时再重建
+        self._stale = generation != self._generation
+        self._expires_at = time.monotonic() + GAME_INDEX_TTL
+        logger.info(f"Game index built: {len(games)} games, {len(genre_to_idx)} genres")
+
+    def invalidate(self):
+        """标记索引过期 (游戏目录增删后调用), 下次使用时重建"""
+        self._stale = True
+        self._generation += 1
+        # 缓存的推荐结果可能包含已删除的游戏或缺少新游戏
+        recommendation_cache.clear()
+
+    async def ensure_fresh(self) -> "GameIndex":
+        """返回可用的索引, 必要时先重建 (同一时刻只有一个协程执行重建)"""
+        if self._needs_refresh():
+            async with self._lock:
+                # 等锁期间其他协程可能已完成重建
+                if self._needs_refresh():
+                    await self.refresh()
+        return self
+
+    def _needs_refresh(self) -> bool:
+        return self._stale or time.monotonic() >= self._expires_at
+
+    def genre_scores(self, genre_weights: Dict[str, int]) -> np.ndarray:
+        """
+        计算所有游戏的偏好匹配得分
+
+        Args:
+            genre_weights: 用户类型权重 {genre: weight}
+
+        Returns:
+            np.ndarray: 长度为size的得分数组, 与self.games顺序一致
+        """
+        scores = np.zeros(self.size, dtype=np.float64)
+        indptr = self.genre_matrix.indptr
+        rows = self.genre_matrix.indices
+        counts = self.genre_matrix.data
+        for genre, weight in genre_weights.items():
+            idx = self.genre_to_idx.get(genre)
+            if idx is None or not weight:
+                continue
+            # 倒排列表: 包含该类型的游戏下标 (同一列内下标唯一)
+            start, end = indptr[idx], indptr[idx + 1]
+            scores[rows[start:end]] += weight * counts[start:end]
+        return scores
+
+
+# 全局推荐索引实例
+game_index = GameIndex()
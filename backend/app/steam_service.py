@@ -10,12 +10,33 @@ Steam数据获取服务 - 直接使用SteamSpy API
 使用 SteamSpy API 的 HTTP 接口:
 - https://steamspy.com/api.php
 """
+import asyncio
 import httpx
-from typing import Dict, List, Optional
+from cachetools import TTLCache
+from typing import Dict, List, Optional, Tuple
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
+# HTTP/2需要h2包 (httpx[http2]), 未安装时使用HTTP/1.1
+try:
+    import h2  # noqa: F401
+    HTTP2_ENABLED = True
+except ImportError:
+    HTTP2_ENABLED = False
+
+# 建立连接失败时的重试次数 (只重试连接错误, 不重试已发出的请求)
+STEAM_CONNECT_RETRIES = 3
+
+# get_top_games并发请求游戏详情的上限 (避免瞬间打满SteamSpy)
+TOP_GAMES_DETAIL_CONCURRENCY = 10
+
+# 游戏详情缓存配置 (SteamSpy限流约1次/秒, 热门游戏会被反复点击/收藏)
+GAME_DETAILS_CACHE_SIZE = int(os.getenv("GAME_DETAILS_CACHE_SIZE", "10000"))
+GAME_DETAILS_CACHE_TTL = int(os.getenv("GAME_DETAILS_CACHE_TTL", "3600"))  # 秒
+GAME_MISSING_CACHE_TTL = int(os.getenv("GAME_MISSING_CACHE_TTL", "300"))  # 未找到的游戏, 秒
+
 
 class SteamService:
     """Steam API封装类 - 直接调用SteamSpy HTTP API"""
@@ -23,60 +44,121 @@ class SteamService:
     BASE_URL = "https://steamspy.com/api.php"
     
     def __init__(self):
-        """初始化HTTP客户端"""
-        self.client = httpx.AsyncClient(timeout=30.0)
+        """初始化HTTP客户端和游戏详情缓存"""
+        # 进程内复用同一个连接池: 保持长连接避免每批请求重新握手TCP+TLS,
+        # 传输层对连接失败自动重试; 可用时启用HTTP/2多路复用
+        # (传入transport时, 连接池和HTTP版本都由transport决定)
+        self.client = httpx.AsyncClient(
+            timeout=30.0,
+            transport=httpx.AsyncHTTPTransport(
+                http2=HTTP2_ENABLED,
+                retries=STEAM_CONNECT_RETRIES,
+                limits=httpx.Limits(
+                    max_connections=100,
+                    max_keepalive_connections=50,
+                    keepalive_expiry=60
+                )
+            ),
+            headers={"Accept-Encoding": "gzip"}
+        )
+        self._details_cache = TTLCache(maxsize=GAME_DETAILS_CACHE_SIZE, ttl=GAME_DETAILS_CACHE_TTL)
+        self._missing_cache = TTLCache(maxsize=GAME_DETAILS_CACHE_SIZE, ttl=GAME_MISSING_CACHE_TTL)
+        # 每个app_id进行中的请求, 同一游戏的并发调用共享其结果 (成功/未找到/失败)
+        self._inflight_details: Dict[int, asyncio.Future] = {}
     
     async def get_game_details(self, app_id: int) -> Optional[Dict]:
         """
         获取单个游戏的详细信息
         
+        结果缓存在进程内 (找到的游戏缓存GAME_DETAILS_CACHE_TTL秒, 未找到的缓存GAME_MISSING_CACHE_TTL秒),
+        同一app_id的并发请求只会向SteamSpy发出一次请求, 失败时等待中的调用同样返回None (不逐个重试);
+        网络错误不缓存, 之后的新调用会重新请求
+        
         Args:
             app_id (int): Steam App ID
         
         Returns:
             Dict: 游戏详细信息,如果未找到返回None
         """
-        try:
-            # 直接调用 SteamSpy HTTP API
-            url = f"{self.BASE_URL}?request=appdetails&appid={app_id}"
-            response = await self.client.get(url)
-            response.raise_for_status()
-            
-            data = response.json()
-            
-            # 检查是否成功返回数据
-            if not data or data.get('name') in ['', None]:
-                logger.warning(f"Game {app_id} not found")
-                return None
-            
-            # 处理价格 - SteamSpy 返回的可能是字符串或整数
-            price_raw = data.get("price", "0")
-            try:
-                price = float(price_raw) / 100 if price_raw not in [None, '', '0'] else 0.0
-            except (ValueError, TypeError):
-                price = 0.0
-            
-            # 提取关键字段
-            game_info = {
-                "app_id": app_id,
-                "name": data.get("name", "Unknown"),
-                "price": price,
-                "genres": data.get("genre", "").split(", ") if data.get("genre") else [],
-                "description": data.get("short_description", "No description available"),
-                "release_date": data.get("release_date", "Unknown"),
-                "positive_reviews": data.get("positive", 0),
-                "negative_reviews": data.get("negative", 0),
-            }
-            
-            logger.info(f"Successfully fetched game: {game_info['name']}")
+        found, game_info = self._get_cached_details(app_id)
+        if found:
             return game_info
-            
+        
+        inflight = self._inflight_details.get(app_id)
+        if inflight is not None:
+            # shield: 本调用被取消时不影响共享的请求
+            game_info = await asyncio.shield(inflight)
+            return dict(game_info) if game_info is not None else None
+        
+        future = asyncio.get_running_loop().create_future()
+        self._inflight_details[app_id] = future
+        game_info = None
+        try:
+            game_info = await self._load_game_details(app_id)
+            if game_info is None:
+                self._missing_cache[app_id] = True
+            else:
+                self._details_cache[app_id] = game_info
         except httpx.HTTPError as e:
             logger.error(f"HTTP error fetching game {app_id}: {e}")
-            return None
         except Exception as e:
             logger.error(f"Failed to fetch game {app_id}: {e}")
+        finally:
+            # 结果已写入缓存 (或请求失败/被取消) 后才移除, 等待中的调用直接得到本次结果
+            self._inflight_details.pop(app_id, None)
+            future.set_result(game_info)
+        
+        return dict(game_info) if game_info is not None else None
+    
+    def _get_cached_details(self, app_id: int) -> Tuple[bool, Optional[Dict]]:
+        """查询缓存, 返回 (是否命中, 游戏信息); 命中的未找到记录返回 (True, None)"""
+        game_info = self._details_cache.get(app_id)
+        if game_info is not None:
+            # 返回副本, 避免调用方修改缓存内容
+            return True, dict(game_info)
+        if app_id in self._missing_cache:
+            return True, None
+        return False, None
+    
+    async def _load_game_details(self, app_id: int) -> Optional[Dict]:
+        """
+        请求SteamSpy并解析游戏详细信息
+        
+        Returns:
+            Dict: 游戏详细信息,如果未找到返回None
+        
+        Raises:
+            httpx.HTTPError: 请求失败
+        """
+        # 直接调用 SteamSpy HTTP API
+        data = await self._fetch_detail(app_id)
+        
+        # 检查是否成功返回数据
+        if not data or data.get('name') in ['', None]:
+            logger.warning(f"Game {app_id} not found")
             return None
+        
+        # 处理价格 - SteamSpy 返回的可能是字符串或整数
+        price_raw = data.get("price", "0")
+        try:
+            price = float(price_raw) / 100 if price_raw not in [None, '', '0'] else 0.0
+        except (ValueError, TypeError):
+            price = 0.0
+        
+        # 提取关键字段
+        game_info = {
+            "app_id": app_id,
+            "name": data.get("name", "Unknown"),
+            "price": price,
+            "genres": data.get("genre", "").split(", ") if data.get("genre") else [],
+            "description": data.get("short_description", "No description available"),
+            "release_date": data.get("release_date", "Unknown"),
+            "positive_reviews": data.get("positive", 0),
+            "negative_reviews": data.get("negative", 0),
+        }
+        
+        logger.info(f"Successfully fetched game: {game_info['name']}")
+        return game_info
     
     async def get_top_games(self, limit: int = 20) -> List[Dict]:
         """
@@ -98,17 +180,26 @@ class SteamService:
             # 获取前N个游戏的app_id
             top_app_ids = list(top_data.keys())[:limit]
             
-            # 为每个游戏获取详细信息（包含genre）
+            # 并发获取每个游戏的详细信息（包含genre），信号量限制同时进行的请求数
+            semaphore = asyncio.Semaphore(TOP_GAMES_DETAIL_CONCURRENCY)
+            
+            async def fetch_bounded(app_id: str) -> Dict:
+                async with semaphore:
+                    return await self._fetch_detail(app_id)
+            
+            details = await asyncio.gather(
+                *(fetch_bounded(app_id) for app_id in top_app_ids),
+                return_exceptions=True
+            )
+            
+            # 按热门排名顺序组装结果
             games = []
-            for app_id in top_app_ids:
+            for app_id, detail_data in zip(top_app_ids, details):
                 try:
-                    game_data = top_data[app_id]
+                    if isinstance(detail_data, Exception):
+                        raise detail_data
                     
-                    # 尝试从详细API获取genre信息
-                    detail_url = f"{self.BASE_URL}?request=appdetails&appid={app_id}"
-                    detail_response = await self.client.get(detail_url)
-                    detail_response.raise_for_status()
-                    detail_data = detail_response.json()
+                    game_data = top_data[app_id]
                     
                     # 处理价格
                     price_raw = detail_data.get("price", "0")
@@ -139,6 +230,18 @@ class SteamService:
             logger.error(f"Failed to fetch top games: {e}")
             return []
     
+    async def _fetch_detail(self, app_id) -> Dict:
+        """
+        请求SteamSpy appdetails接口, 返回原始JSON
+        
+        Raises:
+            httpx.HTTPError: 请求失败或返回非2xx状态码
+        """
+        detail_url = f"{self.BASE_URL}?request=appdetails&appid={app_id}"
+        detail_response = await self.client.get(detail_url)
+        detail_response.raise_for_status()
+        return detail_response.json()
+    
     async def close(self):
         """关闭HTTP客户端"""
         await self.client.aclose()
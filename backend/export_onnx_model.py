@@ -0,0 +1,67 @@
+"""
+导出情感分析模型为INT8量化的ONNX格式
+在Docker构建阶段运行一次, nlp_service检测到导出结果后会改用ONNX Runtime推理
+
+优势:
+- 动态INT8量化后模型权重约为FP32的1/4, 每个uvicorn worker的常驻内存随之下降
+- ONNX Runtime CPU执行器在支持VNNI的CPU上使用int8 GEMM, 吞吐量通常提升2-4倍
+
+使用方法:
+    python export_onnx_model.py
+"""
+from transformers import AutoTokenizer
+from optimum.onnxruntime import ORTModelForSequenceClassification, ORTQuantizer
+from optimum.onnxruntime.configuration import AutoQuantizationConfig
+import numpy as np
+import onnxruntime as ort
+import os
+
+MODEL_NAME = os.getenv("SENTIMENT_MODEL", "philschmid/tiny-bert-sst2-distilled")
+SENTIMENT_ONNX_DIR = os.getenv("SENTIMENT_ONNX_DIR", "/app/models/sentiment-onnx")
+
+
+def export_model():
+    """导出FP32 ONNX模型并进行动态INT8量化"""
+    os.makedirs(SENTIMENT_ONNX_DIR, exist_ok=True)
+    int8_path = os.path.join(SENTIMENT_ONNX_DIR, "model.int8.onnx")
+
+    print(f"加载并导出模型: {MODEL_NAME}")
+    # export=True 由optimum完成ONNX导出 (动态batch/序列长度), 同时保存config (id2label)
+    model = ORTModelForSequenceClassification.from_pretrained(MODEL_NAME, export=True)
+    model.save_pretrained(SENTIMENT_ONNX_DIR)
+    print(f"✓ 已导出FP32模型: {SENTIMENT_ONNX_DIR}")
+
+    # 动态量化 (无需校准数据), 针对AVX512-VNNI的int8 GEMM; 不支持VNNI的CPU上同样可以运行
+    quantizer = ORTQuantizer.from_pretrained(model)
+    qconfig = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+    quantizer.quantize(save_dir=SENTIMENT_ONNX_DIR, quantization_config=qconfig)
+    os.replace(os.path.join(SENTIMENT_ONNX_DIR, "model_quantized.onnx"), int8_path)
+    os.remove(os.path.join(SENTIMENT_ONNX_DIR, "model.onnx"))
+    print(f"✓ 已量化为INT8模型: {int8_path}")
+
+    # tokenizer与模型放在同一目录, 运行时无需访问HuggingFace Hub
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+    tokenizer.save_pretrained(SENTIMENT_ONNX_DIR)
+    
+    verify_model(int8_path, tokenizer)
+    print("完成!")
+
+
+def verify_model(model_path: str, tokenizer):
+    """
+    用与nlp_service相同的方式执行一次推理, 确认导出模型的输入与tokenizer输出匹配
+    (例如BERT模型需要token_type_ids); 失败时抛出异常, 使镜像构建直接失败
+    """
+    session = ort.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+    encoded = tokenizer(["This game is amazing!"], padding="longest", truncation=True,
+                        max_length=512, return_tensors="np")
+    feed = {
+        model_input.name: encoded[model_input.name].astype(np.int64)
+        for model_input in session.get_inputs()
+    }
+    logits = session.run(None, feed)[0]
+    print(f"✓ 推理校验通过: 输入 {list(feed)}, 输出形状 {logits.shape}")
+
+
+if __name__ == "__main__":
+    export_model()
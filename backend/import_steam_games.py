@@ -9,25 +9,43 @@ Steam游戏数据导入脚本
 参数:
     --all: 导入所有游戏（忽略--limit参数）
     --limit: 导入游戏数量限制 (默认: 1000)
-    --batch-size: 批量处理大小 (默认: 50)
-    --skip: 跳过前N款游戏（用于断点续传）
-    --delay: API请求延迟秒数 (默认: 0.5)
+    --batch-size: 批量查重和写入MongoDB的大小 (默认: 50)
+    --skip: 跳过SteamSpy列表的前N款游戏 (按分页获取顺序, 不同时间运行时对应的游戏可能不同)
+    --delay: 相邻两次API请求的最小间隔秒数 (默认: 0.5)
     --retry: 失败重试次数 (默认: 3)
+    --concurrency: 同时进行的详情请求数 (默认: 20)
+    --unsafe-write: 批量写入不等待MongoDB确认 (w=0), 重复/失败的写入不会被统计
+
+断点续传: 中断后重新运行相同命令即可, 已导入的游戏在查重时跳过, 不会重复请求详情;
+上次的处理进度由ProgressSaver保存在 PROGRESS_FILE (启动时显示)
 """
 import asyncio
 import httpx
 import argparse
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
 from motor.motor_asyncio import AsyncIOMotorClient
 from beanie import init_beanie
-from datetime import datetime
+from pymongo import WriteConcern
+from pymongo.errors import BulkWriteError
+try:
+    from pymongo import AsyncMongoClient  # PyMongo >= 4.9
+except ImportError:
+    AsyncMongoClient = None
+from datetime import datetime, timezone
 import sys
 import os
-import json
+import orjson
+import random
+from contextlib import aclosing
+from email.utils import parsedate_to_datetime
 from pathlib import Path
+from typing import AsyncIterator, List, Optional
 
 # 添加app目录到路径
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
-from models import Game
+from models import Game, normalize_genres, compute_popularity, compute_genre_bitmask
 
 # MongoDB配置
 MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://mongodb:27017")
@@ -36,78 +54,283 @@ DATABASE_NAME = os.getenv("DATABASE_NAME", "steamgamerec")
 # SteamSpy API配置
 STEAMSPY_BASE_URL = "https://steamspy.com/api.php"
 
+# 批量写入直接使用Motor集合, 跳过Beanie逐文档的Pydantic校验 (数据来自本脚本构建的字典);
+# 调试时改为False, 改走Beanie模型校验后写入
+RAW_COLLECTION_INSERTS = True
+
+# 可选: 查重和批量写入改用PyMongo原生asyncio驱动, 省去Motor把每次操作转到线程池执行的开销
+# (Beanie 1.23只支持Motor, 建索引和Beanie写入路径仍使用Motor)
+# PyMongo 4.9中该API仍为beta, 默认关闭; 设置 IMPORT_ASYNC_PYMONGO=1 开启, 便于对比两者的写入延迟
+USE_ASYNC_PYMONGO = os.getenv("IMPORT_ASYNC_PYMONGO", "0") == "1"
+
+# games集合句柄 (init_database后缓存)
+games_collection = None
+# init_database创建的数据库客户端 (导入结束时由close_database关闭)
+motor_client = None
+async_mongo_client = None
+
+# MongoDB重复键错误码 (违反app_id唯一索引)
+DUPLICATE_KEY_ERROR = 11000
+
+# HTTP/2需要h2包 (httpx[http2]), 未安装时使用HTTP/1.1
+try:
+    import h2  # noqa: F401
+    HTTP2_ENABLED = True
+except ImportError:
+    HTTP2_ENABLED = False
+
+# 同时进行的详情请求数默认值 (总请求速率仍由--delay限制)
+DEFAULT_CONCURRENCY = 20
+
+# SteamSpy 'all'端点的限制: 每60秒1次请求 (其他端点无此限制)
+ALL_REQUEST_INTERVAL = 60
+# 'all'端点每页游戏数
+ALL_PAGE_SIZE = 1000
+
+# 限流/暂时不可用的状态码: 退避后重试, 并降低全局请求速率
+THROTTLE_STATUS_CODES = {429, 503}
+# 单次退避等待上限 (秒)
+MAX_BACKOFF = 60
+# 被限流后请求间隔最多放大到 --delay 的倍数
+MAX_THROTTLE_FACTOR = 16
+
+# 导入前查重时每次distinct查询的app_id数量 ($in列表过大会使查询文档超过16MB限制)
+DEDUP_CHUNK_SIZE = 10000
+
+# 导入流水线: 待写入队列上限 (写入变慢时HTTP工作协程等待, 限制内存)
+FETCH_QUEUE_SIZE = 500
+# 导入流水线: 写入协程凑不满一批时最长等待秒数
+WRITE_FLUSH_INTERVAL = 1.0
+
 # 进度文件
 PROGRESS_FILE = "/tmp/import_progress.json"
+# 进度文件最短写入间隔 (秒)
+PROGRESS_SAVE_INTERVAL = 5
+
+logger = logging.getLogger("import_steam_games")
+
+
+# ============================================
+# 日志输出
+# ============================================
+class DeferredQueueHandler(QueueHandler):
+    """只把日志记录放入队列; 消息格式化留给监听线程 (QueueHandler默认在调用方格式化)"""
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def start_logging() -> QueueListener:
+    """
+    日志经队列交给后台线程格式化并写入stdout, 事件循环中只做一次入队
+    (大量工作协程直接print会争用stdout锁并在循环中执行写系统调用)
+    返回已启动的监听器, 退出前需调用stop()输出剩余日志
+    """
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter("%(message)s"))
+    listener = QueueListener(log_queue, stream_handler)
+    
+    logger.addHandler(DeferredQueueHandler(log_queue))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    listener.start()
+    return listener
+
+
+class RateLimiter:
+    """
+    全局请求速率限制: 无论并发多少, 相邻两次请求的发起时间间隔不小于interval秒
+    每次调用wait()预约下一个时间槽, 等待在锁外进行, 不会阻塞其他协程预约
+    
+    按AIMD自适应: 被限流时请求间隔加倍 (最多MAX_THROTTLE_FACTOR倍),
+    每次成功后间隔减少一个基础间隔的1/10, 逐步恢复到初始速率
+    """
+    
+    def __init__(self, interval: float):
+        self._base_interval = interval
+        self._interval = interval
+        self._next_time = 0.0
+        self._lock = asyncio.Lock()
+    
+    def throttle(self):
+        """收到限流响应: 请求速率减半"""
+        self._interval = min(self._interval * 2, self._base_interval * MAX_THROTTLE_FACTOR)
+    
+    def recover(self):
+        """请求成功: 线性恢复请求速率"""
+        self._interval = max(self._base_interval, self._interval - self._base_interval / 10)
+    
+    async def wait(self):
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            now = loop.time()
+            slot = max(now, self._next_time)
+            self._next_time = slot + self._interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+def create_http_client(concurrency: int = DEFAULT_CONCURRENCY) -> httpx.AsyncClient:
+    """
+    创建导入过程共用的HTTP客户端
+    连接池不小于并发请求数, 避免请求排队等待连接或用完即断开
+    """
+    return httpx.AsyncClient(
+        timeout=30.0,
+        limits=httpx.Limits(
+            max_connections=max(64, concurrency),
+            max_keepalive_connections=max(32, concurrency)
+        ),
+        http2=HTTP2_ENABLED
+    )
 
 
-async def init_database():
-    """初始化数据库连接"""
-    client = AsyncIOMotorClient(MONGODB_URL)
+async def init_database(unsafe_write: bool = False):
+    """
+    初始化数据库连接
+    unsafe_write: games_collection使用w=0写关注 (不等待写入确认, 省去每批一次确认往返)
+    """
+    global games_collection, motor_client, async_mongo_client
+    motor_client = AsyncIOMotorClient(MONGODB_URL)
     await init_beanie(
-        database=client[DATABASE_NAME],
+        database=motor_client[DATABASE_NAME],
         document_models=[Game]
     )
-    print(f"✓ 数据库已连接: {DATABASE_NAME}")
+    if USE_ASYNC_PYMONGO and AsyncMongoClient is not None:
+        async_mongo_client = AsyncMongoClient(MONGODB_URL)
+        games_collection = async_mongo_client[DATABASE_NAME][Game.get_collection_name()]
+        logger.info("✓ 批量写入使用PyMongo原生asyncio驱动")
+    else:
+        games_collection = Game.get_motor_collection()
+    if unsafe_write:
+        # 只影响games_collection上的批量写入 (RAW_COLLECTION_INSERTS); 中断后可重新运行, 已写入的游戏会在查重时跳过
+        games_collection = games_collection.with_options(write_concern=WriteConcern(w=0))
+        logger.info("⚠️  已关闭写入确认 (w=0): 成功数为已提交数, 重复和失败的写入不会被发现")
+    logger.info(f"✓ 数据库已连接: {DATABASE_NAME}")
+
+
+async def close_database():
+    """关闭init_database创建的数据库客户端"""
+    global games_collection, motor_client, async_mongo_client
+    if async_mongo_client is not None:
+        await async_mongo_client.close()  # PyMongo异步客户端的close是协程
+        async_mongo_client = None
+    if motor_client is not None:
+        motor_client.close()
+        motor_client = None
+    games_collection = None
 
 
-async def fetch_all_games():
+async def fetch_all_games() -> AsyncIterator[List[int]]:
     """
-    从SteamSpy获取所有游戏的基础信息（支持分页）
+    从SteamSpy逐页获取所有游戏的app_id（异步生成器, 每获取一页立即产出, 不在内存中累积整个目录）
     注意: SteamSpy API限制 - all请求每60秒只能1次
-    返回: dict {app_id: game_data}
+    产出: 本页的app_id列表 (页内按app_id排序)
     """
-    print("正在从SteamSpy获取所有游戏列表...")
-    print("⚠️  注意: SteamSpy 'all'端点限制每60秒1次请求，获取全部数据需要较长时间...")
+    logger.info("正在从SteamSpy获取所有游戏列表...")
+    logger.info("⚠️  注意: SteamSpy 'all'端点限制每60秒1次请求，获取全部数据需要较长时间 (边获取列表边导入)...")
     
-    all_games = {}
+    total = 0
     page = 0
+    # 按请求发起时间计算间隔: 下载和解析页面(数MB)的耗时计入60秒等待内
+    limiter = RateLimiter(ALL_REQUEST_INTERVAL)
     
     async with httpx.AsyncClient(timeout=60.0) as client:
         while True:
             try:
-                print(f"  正在获取第 {page + 1} 页...")
+                await limiter.wait()
+                logger.info(f"  正在获取第 {page + 1} 页...")
                 url = f"{STEAMSPY_BASE_URL}?request=all&page={page}"
                 response = await client.get(url)
                 response.raise_for_status()
                 
-                data = response.json()
-                
-                # 如果返回空数据或没有新数据，说明已经获取完所有游戏
-                if not data or len(data) == 0:
-                    break
-                
-                all_games.update(data)
-                print(f"  ✓ 第 {page + 1} 页: 获取 {len(data)} 款游戏 (累计: {len(all_games)} 款)")
-                
-                page += 1
-                
-                # SteamSpy API限制: all请求每60秒1次
-                # 为了避免被限流，每页之间等待60秒
-                if len(data) == 1000:  # 如果返回满页，说明可能还有下一页
-                    print(f"  ⏳ 等待60秒以遵守API限制...")
-                    await asyncio.sleep(60)
-                else:
-                    break  # 如果不是满页，说明这是最后一页了
-                    
+                # orjson直接解析响应字节 ('all'页面有数MB, 比response.json()快数倍)
+                data = orjson.loads(response.content)
             except Exception as e:
-                print(f"  ✗ 获取第 {page + 1} 页时出错: {str(e)}")
+                logger.warning(f"  ✗ 获取第 {page + 1} 页时出错: {str(e)}")
+                break
+            
+            # 如果返回空数据或没有新数据，说明已经获取完所有游戏
+            if not data:
                 break
+            
+            # 只保留app_id, 页面中的其他字段不再需要
+            app_ids = list(map(int, data))
+            app_ids.sort()
+            total += len(app_ids)
+            logger.info(f"  ✓ 第 {page + 1} 页: 获取 {len(app_ids)} 款游戏 (累计: {total} 款)")
+            yield app_ids
+            
+            page += 1
+            
+            # SteamSpy API限制: all请求每60秒1次
+            # 下一次请求由limiter等到距本次请求发起满60秒
+            if len(app_ids) < ALL_PAGE_SIZE:
+                break  # 如果不是满页，说明这是最后一页了
     
-    print(f"✓ 总共获取到 {len(all_games)} 款游戏")
-    return all_games
+    logger.info(f"✓ 总共获取到 {total} 款游戏")
+
+
+async def select_app_ids(pages: AsyncIterator[List[int]], skip: int = 0,
+                         limit: Optional[int] = None) -> AsyncIterator[List[int]]:
+    """
+    按获取顺序逐页应用--skip/--limit; 达到limit后停止, 不再请求后续页面
+    注意: skip按SteamSpy分页顺序计数 (各页内按app_id排序), 列表更新后同一skip值对应的游戏会变化,
+    不能用于断点续传 (续传依赖导入前查重, 见ImportPipeline._feed)
+    """
+    async with aclosing(pages):
+        async for app_ids in pages:
+            if skip > 0:
+                skipped = min(skip, len(app_ids))
+                app_ids = app_ids[skipped:]
+                skip -= skipped
+            if limit is not None:
+                app_ids = app_ids[:limit]
+                limit -= len(app_ids)
+            if app_ids:
+                yield app_ids
+            if limit == 0:
+                return
+
+
+def parse_retry_after(response: httpx.Response) -> float:
+    """解析Retry-After响应头 (秒数或HTTP日期), 无法解析时返回0"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return 0.0
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now().astimezone()).total_seconds())
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def backoff_delay(attempt: int, retry_after: float = 0.0) -> float:
+    """指数退避 + 全抖动 (避免并发请求同时重试); 服务端给出Retry-After时至少等待该时长"""
+    return max(retry_after, random.uniform(0, min(MAX_BACKOFF, 2 ** attempt)))
 
 
-async def fetch_game_details(app_id: int, client: httpx.AsyncClient, retry_count: int = 3):
+async def fetch_game_details(app_id: int, client: httpx.AsyncClient, retry_count: int = 3,
+                             limiter: RateLimiter = None):
     """
-    获取单个游戏的详细信息（带重试机制）
+    获取单个游戏的详细信息（带重试机制, 重试前按指数退避等待）
+    limiter: 每次请求(包括重试)前等待的速率限制器, 被限流时同时降低其速率
     """
     for attempt in range(retry_count):
         try:
+            if limiter is not None:
+                await limiter.wait()
             url = f"{STEAMSPY_BASE_URL}?request=appdetails&appid={app_id}"
             response = await client.get(url)
             response.raise_for_status()
             
-            data = response.json()
+            data = orjson.loads(response.content)
+            if limiter is not None:
+                limiter.recover()
             
             # 验证数据有效性
             if not data or not data.get('name'):
@@ -125,7 +348,8 @@ async def fetch_game_details(app_id: int, client: httpx.AsyncClient, retry_count
                 "app_id": app_id,
                 "name": data.get("name", "Unknown"),
                 "price": price,
-                "genres": data.get("genre", "").split(", ") if data.get("genre") else [],
+                # genre字符串分割结果有缓存 (同样的类型组合会反复出现)
+                "genres": normalize_genres(data.get("genre")),
                 "description": data.get("short_description", "No description available"),
                 "release_date": data.get("release_date", "Unknown"),
                 "positive_reviews": data.get("positive", 0),
@@ -135,72 +359,244 @@ async def fetch_game_details(app_id: int, client: httpx.AsyncClient, retry_count
             return game_data
             
         except httpx.HTTPStatusError as e:
-            if e.response.status_code == 429:  # Too Many Requests
-                wait_time = (attempt + 1) * 2  # 递增等待时间
-                print(f"  ⚠ API限流，等待{wait_time}秒...")
+            if e.response.status_code in THROTTLE_STATUS_CODES:  # Too Many Requests / Service Unavailable
+                if limiter is not None:
+                    limiter.throttle()
+                if attempt == retry_count - 1:
+                    logger.warning("  ✗ 获取游戏 %s 失败: HTTP %s", app_id, e.response.status_code)
+                    return None
+                wait_time = backoff_delay(attempt, parse_retry_after(e.response))
+                logger.warning("  ⚠ API限流，等待%.1f秒...", wait_time)
                 await asyncio.sleep(wait_time)
             else:
                 if attempt == retry_count - 1:
-                    print(f"  ✗ 获取游戏 {app_id} 失败: HTTP {e.response.status_code}")
+                    logger.warning("  ✗ 获取游戏 %s 失败: HTTP %s", app_id, e.response.status_code)
                 return None
         except Exception as e:
             if attempt == retry_count - 1:
-                print(f"  ✗ 获取游戏 {app_id} 失败: {e}")
-            await asyncio.sleep(1)
+                logger.warning("  ✗ 获取游戏 %s 失败: %s", app_id, e)
+                return None
+            await asyncio.sleep(backoff_delay(attempt))
     
     return None
 
 
-async def import_games_batch(app_ids: list, batch_num: int, total_batches: int, delay: float = 0.5, retry: int = 3):
+def build_game_document(game_data: dict, created_at: datetime) -> dict:
+    """
+    补全为与Game模型一致的MongoDB文档 (包括Game.compute_derived_fields计算的派生字段)
+    直接在game_data上添加字段, 不复制字典
+    """
+    genres = normalize_genres(game_data["genres"])
+    game_data["genres"] = genres
+    game_data["created_at"] = created_at
+    game_data["popularity"] = compute_popularity(game_data["positive_reviews"])
+    game_data["genre_bitmask"] = compute_genre_bitmask(genres)
+    return game_data
+
+
+async def insert_games(games: list):
+    """
+    一次往返批量写入游戏 (games为fetch_game_details返回的字典)
+    ordered=False: 个别文档违反app_id唯一索引(已存在)时, 其余文档照常写入
+    
+    返回: (写入数, 已存在数)
+    """
+    if not games:
+        return 0, 0
+    
+    if RAW_COLLECTION_INSERTS:
+        # 同一批次共用一个写入时间
+        created_at = datetime.now(timezone.utc)
+        insert = games_collection.insert_many(
+            [build_game_document(game_data, created_at) for game_data in games], ordered=False
+        )
+    else:
+        documents = [Game(**game_data) for game_data in games]
+        # insert_many直接走Motor, 不会触发Beanie的before_event钩子
+        for game in documents:
+            game.compute_derived_fields()
+        insert = Game.insert_many(documents, ordered=False)
+    
+    try:
+        result = await insert
+        return len(result.inserted_ids), 0
+    except BulkWriteError as e:
+        write_errors = e.details.get("writeErrors", [])
+        duplicates = sum(1 for err in write_errors if err.get("code") == DUPLICATE_KEY_ERROR)
+        if duplicates < len(write_errors):
+            logger.warning("  ✗ 批量写入失败 %d 条: %s", len(write_errors) - duplicates, write_errors[0].get('errmsg'))
+        return e.details.get("nInserted", 0), duplicates
+
+
+async def find_existing_app_ids(app_ids: list) -> set:
+    """找出数据库中已存在的app_id (按DEDUP_CHUNK_SIZE分段distinct, 使用app_id唯一索引)"""
+    existing_ids = set()
+    for i in range(0, len(app_ids), DEDUP_CHUNK_SIZE):
+        chunk = app_ids[i:i + DEDUP_CHUNK_SIZE]
+        existing_ids.update(await games_collection.distinct("app_id", {"app_id": {"$in": chunk}}))
+    return existing_ids
+
+
+class ImportPipeline:
     """
-    批量导入游戏数据
+    生产者/消费者导入流水线 (HTTP请求与MongoDB写入互相重叠, 不再逐批次先抓取再写入)
+    - 投递协程: 每收到一页app_id, 一次distinct查重后把待获取的放入输入队列
+    - concurrency个HTTP工作协程: 从输入队列取app_id获取详情 (请求速率由limiter限制), 放入输出队列
+    - 1个写入协程: 凑满batch_size条或等待WRITE_FLUSH_INTERVAL秒后批量写入MongoDB
+    输出队列有上限 (FETCH_QUEUE_SIZE), 写入变慢时HTTP工作协程会等待, 内存不会无限增长
     """
-    print(f"\n[批次 {batch_num}/{total_batches}] 处理 {len(app_ids)} 款游戏...")
     
-    success_count = 0
-    skip_count = 0
-    error_count = 0
+    def __init__(self, client: httpx.AsyncClient, limiter: RateLimiter, concurrency: int,
+                 batch_size: int, retry: int, on_flush=None):
+        self._client = client
+        self._limiter = limiter
+        self._concurrency = concurrency
+        self._batch_size = batch_size
+        self._retry = retry
+        self._on_flush = on_flush  # 每次批量写入后调用 on_flush(pipeline)
+        self.batches = 0
+        self.discovered = 0  # 已收到的app_id数
+        self.processed = 0
+        self.success = 0
+        self.skip = 0
+        self.error = 0
+    
+    async def run(self, pages: AsyncIterator[List[int]]):
+        """导入pages逐页产出的游戏, 全部写入完成后返回"""
+        in_queue = asyncio.Queue(maxsize=self._concurrency * 2)
+        out_queue = asyncio.Queue(maxsize=FETCH_QUEUE_SIZE)
+        
+        writer = asyncio.create_task(self._write(out_queue))
+        workers = [
+            asyncio.create_task(self._fetch(in_queue, out_queue))
+            for _ in range(self._concurrency)
+        ]
+        try:
+            await self._feed(pages, in_queue)
+            await asyncio.gather(*workers)
+            await out_queue.put(None)  # 结束标记
+            await writer
+        except BaseException:
+            for task in (*workers, writer):
+                task.cancel()
+            raise
+    
+    async def _feed(self, pages: AsyncIterator[List[int]], in_queue: asyncio.Queue):
+        async for app_ids in pages:
+            self.discovered += len(app_ids)
+            
+            # 已存在的游戏直接计入跳过, 只有待获取的app_id进入HTTP队列
+            existing_ids = await find_existing_app_ids(app_ids)
+            self.skip += len(existing_ids)
+            self.processed += len(existing_ids)
+            to_fetch = [app_id for app_id in app_ids if app_id not in existing_ids] if existing_ids else app_ids
+            
+            for app_id in to_fetch:
+                await in_queue.put(app_id)
+        
+        # 每个工作协程一个结束标记
+        for _ in range(self._concurrency):
+            await in_queue.put(None)
     
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        for i, app_id in enumerate(app_ids, 1):
+    async def _fetch(self, in_queue: asyncio.Queue, out_queue: asyncio.Queue):
+        while True:
+            app_id = await in_queue.get()
+            if app_id is None:
+                return
             try:
-                # 检查是否已存在
-                existing = await Game.find_one(Game.app_id == app_id)
-                if existing:
-                    skip_count += 1
-                    if i % 20 == 0:
-                        print(f"  进度: {i}/{len(app_ids)} | 成功: {success_count} | 跳过: {skip_count} | 失败: {error_count}")
-                    continue
-                
-                # 获取详细信息（带重试）
-                game_data = await fetch_game_details(app_id, client, retry)
-                
-                if game_data:
-                    # 保存到数据库
-                    game = Game(**game_data)
-                    await game.insert()
-                    success_count += 1
-                else:
-                    error_count += 1
-                
-                # 每20个游戏显示一次进度
-                if i % 20 == 0:
-                    print(f"  进度: {i}/{len(app_ids)} | 成功: {success_count} | 跳过: {skip_count} | 失败: {error_count}")
-                
-                # API限流控制
-                await asyncio.sleep(delay)
-                
+                # 获取详细信息（带重试）, 失败时为None
+                game_data = await fetch_game_details(app_id, self._client, self._retry, self._limiter)
             except Exception as e:
-                error_count += 1
-                print(f"  ✗ 处理游戏 {app_id} 时出错: {e}")
+                logger.warning("  ✗ 处理游戏 %s 时出错: %s", app_id, e)
+                game_data = None
+            await out_queue.put((app_id, game_data))
     
-    print(f"[批次 {batch_num}] 完成 - 成功: {success_count} | 跳过: {skip_count} | 失败: {error_count}")
-    return success_count, skip_count, error_count
+    async def _write(self, out_queue: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await out_queue.get()
+            if item is None:
+                return
+            buffer = [item]
+            deadline = loop.time() + WRITE_FLUSH_INTERVAL
+            
+            stopping = False
+            while len(buffer) < self._batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(out_queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                buffer.append(item)
+            
+            await self._flush(buffer)
+            if stopping:
+                return
+    
+    async def _flush(self, buffer: list):
+        pending = [game_data for _, game_data in buffer if game_data]
+        success = 0
+        skip = 0
+        error = len(buffer) - len(pending)
+        
+        # 保存到数据库
+        try:
+            inserted, duplicates = await insert_games(pending)
+            success += inserted
+            skip += duplicates
+            error += len(pending) - inserted - duplicates
+        except Exception as e:
+            error += len(pending)
+            logger.error("  ✗ 写入数据库时出错: %s", e)
+        
+        self.batches += 1
+        self.processed += len(buffer)
+        self.success += success
+        self.skip += skip
+        self.error += error
+        logger.info("[批次 %d] 写入 %d 款 - 成功: %d | 跳过: %d | 失败: %d",
+                    self.batches, len(buffer), success, skip, error)
+        
+        if self._on_flush is not None:
+            self._on_flush(self)
 
 
-def save_progress(processed_count: int, total_count: int, success: int, skip: int, error: int):
-    """保存导入进度"""
+def save_progress(progress: dict):
+    """保存导入进度 (先写临时文件再原子替换, 中途崩溃不会留下写了一半的进度文件)"""
     try:
+        tmp_file = PROGRESS_FILE + ".tmp"
+        with open(tmp_file, 'wb') as f:
+            f.write(orjson.dumps(progress))
+        os.replace(tmp_file, PROGRESS_FILE)
+    except Exception as e:
+        logger.warning("保存进度失败: %s", e)
+
+
+class ProgressSaver:
+    """
+    后台保存导入进度
+    - 文件写入放到线程中执行, 不阻塞事件循环
+    - 至多每PROGRESS_SAVE_INTERVAL秒写一次; 上一次写入未完成时跳过本次
+    """
+    
+    def __init__(self, interval: float = PROGRESS_SAVE_INTERVAL):
+        self._interval = interval
+        self._last_saved = float("-inf")
+        self._task = None
+    
+    def save(self, processed_count: int, total_count: int, success: int, skip: int, error: int):
+        """提交一次进度 (不等待写入完成)"""
+        now = asyncio.get_running_loop().time()
+        if now - self._last_saved < self._interval:
+            return
+        if self._task is not None and not self._task.done():
+            return
+        self._last_saved = now
         progress = {
             "processed": processed_count,
             "total": total_count,
@@ -209,127 +605,119 @@ def save_progress(processed_count: int, total_count: int, success: int, skip: in
             "error": error,
             "timestamp": datetime.now().isoformat()
         }
-        with open(PROGRESS_FILE, 'w') as f:
-            json.dump(progress, f)
-    except Exception as e:
-        print(f"保存进度失败: {e}")
+        self._task = asyncio.create_task(asyncio.to_thread(save_progress, progress))
+    
+    async def wait(self):
+        """等待进行中的写入完成"""
+        if self._task is not None:
+            await self._task
 
 
 def load_progress():
     """加载导入进度"""
     try:
         if Path(PROGRESS_FILE).exists():
-            with open(PROGRESS_FILE, 'r') as f:
-                return json.load(f)
+            with open(PROGRESS_FILE, 'rb') as f:
+                return orjson.loads(f.read())
     except Exception as e:
-        print(f"加载进度失败: {e}")
+        logger.warning("加载进度失败: %s", e)
     return None
 
 
 async def import_all_games(import_all: bool = False, limit: int = 1000, batch_size: int = 50, 
-                          skip: int = 0, delay: float = 0.5, retry: int = 3):
+                          skip: int = 0, delay: float = 0.5, retry: int = 3,
+                          concurrency: int = DEFAULT_CONCURRENCY, unsafe_write: bool = False):
     """
     主导入函数
     """
     start_time = datetime.now()
-    print("\n" + "="*70)
-    print("Steam游戏数据批量导入工具 v2.0")
-    print("="*70)
+    logger.info("\n" + "="*70)
+    logger.info("Steam游戏数据批量导入工具 v2.0")
+    logger.info("="*70)
     
     # 初始化数据库
-    await init_database()
-    
-    # 获取所有游戏列表
-    all_games = await fetch_all_games()
-    
-    # 转换为列表并排序（按app_id排序以保证一致性）
-    app_ids = sorted([int(app_id) for app_id in all_games.keys()])
-    total_available = len(app_ids)
-    
-    print(f"\nSteam游戏总数: {total_available:,} 款")
-    
-    # 应用skip参数
-    if skip > 0:
-        print(f"跳过前 {skip} 款游戏")
-        app_ids = app_ids[skip:]
+    await init_database(unsafe_write)
     
     # 确定要导入的游戏数量
     if import_all:
-        print(f"模式: 导入所有游戏")
-        games_to_import = len(app_ids)
+        logger.info(f"模式: 导入所有游戏")
     else:
-        games_to_import = min(limit, len(app_ids))
-        app_ids = app_ids[:games_to_import]
-        print(f"模式: 限制导入 {games_to_import} 款游戏")
+        logger.info(f"模式: 限制导入 {limit} 款游戏")
+    if skip > 0:
+        logger.info(f"跳过前 {skip} 款游戏")
     
-    print(f"批次大小: {batch_size}")
-    print(f"API延迟: {delay}秒")
-    print(f"重试次数: {retry}")
+    logger.info(f"批次大小: {batch_size}")
+    logger.info(f"API请求间隔: {delay}秒")
+    logger.info(f"并发请求数: {concurrency}")
+    logger.info(f"重试次数: {retry}")
     
     # 检查是否有保存的进度
     saved_progress = load_progress()
     if saved_progress and not import_all:
-        print(f"\n发现保存的进度:")
-        print(f"  已处理: {saved_progress['processed']}/{saved_progress['total']}")
-        print(f"  成功: {saved_progress['success']}, 跳过: {saved_progress['skip']}, 失败: {saved_progress['error']}")
-    
-    # 估算时间
-    estimated_time = (games_to_import * (delay + 0.5)) / 60  # 分钟
-    if estimated_time >= 60:
-        print(f"预计耗时: {estimated_time/60:.1f} 小时")
-    else:
-        print(f"预计耗时: {estimated_time:.1f} 分钟")
+        logger.info(f"\n发现保存的进度:")
+        logger.info(f"  已处理: {saved_progress['processed']}/{saved_progress['total']}")
+        logger.info(f"  成功: {saved_progress['success']}, 跳过: {saved_progress['skip']}, 失败: {saved_progress['error']}")
     
-    # 分批处理
-    total_success = 0
-    total_skip = 0
-    total_error = 0
-    processed = 0
+    # 估算时间 (全量导入时游戏总数要等列表获取完才知道)
+    # 每次请求约0.5秒, 并发后受请求间隔限制
+    if not import_all:
+        estimated_time = (limit * max(delay, 0.5 / concurrency)) / 60  # 分钟
+        if estimated_time >= 60:
+            logger.info(f"预计耗时: {estimated_time/60:.1f} 小时")
+        else:
+            logger.info(f"预计耗时: {estimated_time:.1f} 分钟")
     
-    total_batches = (len(app_ids) + batch_size - 1) // batch_size
+    # 所有请求复用同一个HTTP客户端, 保持长连接; 共享同一个请求速率限制
+    client = create_http_client(concurrency)
+    limiter = RateLimiter(delay)
+    progress_saver = ProgressSaver()
     
-    print(f"\n开始导入 (共{total_batches}批次)...")
-    print("="*70)
-    
-    for i in range(0, len(app_ids), batch_size):
-        batch = app_ids[i:i + batch_size]
-        batch_num = i // batch_size + 1
-        
-        success, skip_count, error = await import_games_batch(
-            batch, batch_num, total_batches, delay, retry
-        )
-        
-        total_success += success
-        total_skip += skip_count
-        total_error += error
-        processed += len(batch)
-        
+    def report_progress(pipeline: ImportPipeline):
         # 保存进度
-        save_progress(processed, games_to_import, total_success, total_skip, total_error)
+        progress_saver.save(pipeline.processed, pipeline.discovered, pipeline.success, pipeline.skip, pipeline.error)
         
-        # 每10个批次显示总体进度
-        if batch_num % 10 == 0:
+        # 每10个批次显示总体进度 (游戏列表边获取边导入, 以已获取到的游戏数为总数)
+        if pipeline.batches % 10 == 0:
             elapsed = (datetime.now() - start_time).total_seconds()
-            rate = processed / elapsed if elapsed > 0 else 0
-            remaining = (games_to_import - processed) / rate if rate > 0 else 0
-            print(f"\n📊 总体进度: {processed}/{games_to_import} ({processed/games_to_import*100:.1f}%)")
-            print(f"   成功: {total_success} | 跳过: {total_skip} | 失败: {total_error}")
-            print(f"   速度: {rate:.1f} 游戏/秒 | 剩余时间: {remaining/60:.1f} 分钟\n")
+            rate = pipeline.processed / elapsed if elapsed > 0 else 0
+            logger.info("\n📊 总体进度: %d/%d (已获取列表)\n   成功: %d | 跳过: %d | 失败: %d\n   速度: %.1f 游戏/秒\n",
+                        pipeline.processed, pipeline.discovered,
+                        pipeline.success, pipeline.skip, pipeline.error, rate)
+    
+    pipeline = ImportPipeline(client, limiter, concurrency, batch_size, retry, on_flush=report_progress)
+    
+    logger.info(f"\n开始导入...")
+    logger.info("="*70)
+    
+    try:
+        # 游戏列表逐页流入导入流水线: 等待下一页列表(60秒限制)期间同时获取已有页面的游戏详情
+        await pipeline.run(select_app_ids(fetch_all_games(), skip, None if import_all else limit))
+    finally:
+        # 出错或中断时同样释放HTTP连接和数据库客户端
+        await client.aclose()
+        # 等待最后一次进度写入结束, 避免删除进度文件后又被写回
+        await progress_saver.wait()
+        await close_database()
+    
+    total_success = pipeline.success
+    total_skip = pipeline.skip
+    total_error = pipeline.error
+    processed = pipeline.processed
     
     # 统计结果
     end_time = datetime.now()
     duration = (end_time - start_time).total_seconds()
     
-    print("\n" + "="*70)
-    print("导入完成!")
-    print("="*70)
-    print(f"总计处理: {processed:,} 款游戏")
-    print(f"✓ 成功导入: {total_success:,}")
-    print(f"○ 已存在跳过: {total_skip:,}")
-    print(f"✗ 失败: {total_error:,}")
-    print(f"⏱ 耗时: {duration/60:.1f} 分钟 ({duration:.1f} 秒)")
-    print(f"⚡ 平均速度: {processed/duration:.2f} 游戏/秒")
-    print("="*70)
+    logger.info("\n" + "="*70)
+    logger.info("导入完成!")
+    logger.info("="*70)
+    logger.info(f"总计处理: {processed:,} 款游戏")
+    logger.info(f"✓ 成功导入: {total_success:,}")
+    logger.info(f"○ 已存在跳过: {total_skip:,}")
+    logger.info(f"✗ 失败: {total_error:,}")
+    logger.info(f"⏱ 耗时: {duration/60:.1f} 分钟 ({duration:.1f} 秒)")
+    logger.info(f"⚡ 平均速度: {processed/duration:.2f} 游戏/秒")
+    logger.info("="*70)
     
     # 清理进度文件
     try:
@@ -355,11 +743,20 @@ def main():
   # 导入5000款游戏
   python import_steam_games.py --limit 5000
   
-  # 从第1000款开始导入
+  # 跳过列表前1000款, 导入之后的1000款
   python import_steam_games.py --skip 1000 --limit 1000
   
+  # 中断后续传: 重新运行相同命令 (已导入的游戏自动跳过)
+  python import_steam_games.py --all
+  
   # 调整批次和延迟
   python import_steam_games.py --all --batch-size 100 --delay 1.0
+  
+  # 提高并发请求数（总请求速率仍受--delay限制）
+  python import_steam_games.py --all --concurrency 50 --delay 0.2
+  
+  # 首次全量导入, 不等待写入确认
+  python import_steam_games.py --all --unsafe-write
         """
     )
     
@@ -370,11 +767,15 @@ def main():
     parser.add_argument('--batch-size', type=int, default=50,
                        help='批次大小 (默认: 50, 建议: 20-100)')
     parser.add_argument('--skip', type=int, default=0,
-                       help='跳过前N款游戏（用于断点续传）')
+                       help='跳过SteamSpy列表的前N款游戏 (按分页顺序; 续传无需此参数, 已导入的游戏自动跳过)')
     parser.add_argument('--delay', type=float, default=0.5,
-                       help='API请求延迟秒数 (默认: 0.5, 建议: 0.3-2.0)')
+                       help='相邻两次API请求的最小间隔秒数 (默认: 0.5, 建议: 0.3-2.0)')
     parser.add_argument('--retry', type=int, default=3,
                        help='失败重试次数 (默认: 3)')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                       help=f'同时进行的详情请求数 (默认: {DEFAULT_CONCURRENCY}, 建议: 5-50)')
+    parser.add_argument('--unsafe-write', action='store_true',
+                       help='批量写入不等待MongoDB确认 (w=0), 重复/失败的写入不会被统计')
     
     args = parser.parse_args()
     
@@ -387,19 +788,29 @@ def main():
         print("错误: delay 必须在 0.1-10 之间")
         return
     
+    if args.concurrency < 1 or args.concurrency > 200:
+        print("错误: concurrency 必须在 1-200 之间")
+        return
+    
     if args.skip < 0:
         print("错误: skip 不能为负数")
         return
     
     # 运行导入
-    asyncio.run(import_all_games(
-        import_all=args.all,
-        limit=args.limit,
-        batch_size=args.batch_size,
-        skip=args.skip,
-        delay=args.delay,
-        retry=args.retry
-    ))
+    listener = start_logging()
+    try:
+        asyncio.run(import_all_games(
+            import_all=args.all,
+            limit=args.limit,
+            batch_size=args.batch_size,
+            skip=args.skip,
+            delay=args.delay,
+            retry=args.retry,
+            concurrency=args.concurrency,
+            unsafe_write=args.unsafe_write
+        ))
+    finally:
+        listener.stop()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,74 @@
+"""
+一次性迁移脚本 - 规范化历史游戏数据的genres字段, 并补齐派生字段 (popularity / genre_bitmask)
+新写入的Game会在before_event钩子中自动处理, 此脚本只需对旧数据运行一次
+(已有数据库需先运行migrate_indexes.py, 否则init_beanie会因app_id索引冲突失败)
+
+使用方法:
+    docker-compose exec backend python migrate_genres.py
+"""
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+from beanie import init_beanie
+from pymongo import UpdateOne
+import os
+import sys
+
+sys.path.insert(0, '/app')
+from app.models import Game, compute_genre_bitmask, compute_popularity, normalize_genres
+
+MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://mongodb:27017")
+DATABASE_NAME = os.getenv("DATABASE_NAME", "steamgamerec")
+
+# 需要迁移的文档: genres是字符串, 或是只有一个含逗号元素的数组, 或缺少派生字段
+LEGACY_GENRES_FILTER = {
+    "$or": [
+        {"genres": {"$type": "string"}},
+        {"genres.0": {"$regex": ","}, "genres.1": {"$exists": False}},
+        {"genre_bitmask": {"$exists": False}},
+    ]
+}
+
+
+async def init_db():
+    """初始化数据库"""
+    client = AsyncIOMotorClient(MONGODB_URL)
+    await init_beanie(
+        database=client[DATABASE_NAME],
+        document_models=[Game]
+    )
+    print("✓ 数据库已连接")
+
+
+async def migrate_genres(batch_size=500):
+    """批量规范化genres字段并计算派生字段"""
+    collection = Game.get_motor_collection()
+    cursor = collection.find(LEGACY_GENRES_FILTER, {"_id": 1, "genres": 1, "positive_reviews": 1})
+
+    ops = []
+    updated = 0
+    async for doc in cursor:
+        genres = normalize_genres(doc.get("genres"))
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {
+            "genres": genres,
+            "popularity": compute_popularity(doc.get("positive_reviews")),
+            "genre_bitmask": compute_genre_bitmask(genres),
+        }}))
+        if len(ops) >= batch_size:
+            result = await collection.bulk_write(ops, ordered=False)
+            updated += result.modified_count
+            ops = []
+
+    if ops:
+        result = await collection.bulk_write(ops, ordered=False)
+        updated += result.modified_count
+
+    print(f"完成! 迁移 {updated} 款游戏")
+
+
+async def main():
+    await init_db()
+    await migrate_genres()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
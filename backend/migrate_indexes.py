@@ -0,0 +1,111 @@
+"""
+一次性迁移脚本 - 为已有数据库建立唯一索引 (games.app_id / users.user_id)
+
+旧版爬虫在games集合上创建过非唯一的 app_id_1 索引; 模型改为唯一索引后,
+init_beanie遇到同名但选项不同的索引会报 IndexOptionsConflict, 后端和爬虫都无法启动
+已有重复app_id (或user_id) 的数据也会使唯一索引创建失败
+
+步骤 (只使用Motor, 不调用init_beanie, 因此可以在冲突的数据库上运行):
+1. 去重: 每个app_id保留最近更新的一条游戏; 同一user_id的用户合并收藏并保留最近活跃的一条
+2. 删除旧的非唯一 app_id_1 索引
+3. 创建唯一索引
+
+部署唯一索引版本的后端/爬虫之前运行一次 (之后再运行migrate_genres.py); 重复运行无副作用
+
+使用方法:
+    docker-compose exec backend python migrate_indexes.py
+    MONGODB_URL="mongodb+srv://..." python migrate_indexes.py   # MongoDB Atlas
+"""
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING
+import os
+
+MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://mongodb:27017")
+DATABASE_NAME = os.getenv("DATABASE_NAME", "steamgamerec")
+
+# 每次delete_many删除的重复文档数
+DELETE_BATCH_SIZE = 1000
+
+
+async def find_duplicates(collection, key: str, sort: dict):
+    """
+    按key分组找出重复文档, 每组按sort排序后第一条为保留文档
+
+    Returns:
+        异步迭代 {"_id": key值, "docs": [完整文档, ...]}
+    """
+    pipeline = [
+        {"$sort": sort},
+        {"$group": {"_id": f"${key}", "docs": {"$push": "$$ROOT"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ]
+    async for group in collection.aggregate(pipeline, allowDiskUse=True):
+        yield group
+
+
+async def delete_ids(collection, ids: list) -> int:
+    """分批删除文档, 返回删除数量"""
+    deleted = 0
+    for i in range(0, len(ids), DELETE_BATCH_SIZE):
+        result = await collection.delete_many({"_id": {"$in": ids[i:i + DELETE_BATCH_SIZE]}})
+        deleted += result.deleted_count
+    return deleted
+
+
+async def dedupe_games(db) -> int:
+    """每个app_id保留最近更新 (updated_at, 其次created_at) 的一条游戏"""
+    collection = db["games"]
+    sort = {"updated_at": -1, "created_at": -1, "_id": -1}
+    to_delete = []
+    async for group in find_duplicates(collection, "app_id", sort):
+        to_delete.extend(doc["_id"] for doc in group["docs"][1:])
+    return await delete_ids(collection, to_delete)
+
+
+async def dedupe_users(db) -> int:
+    """同一user_id的用户合并favorite_games, 保留最近活跃的一条"""
+    collection = db["users"]
+    sort = {"last_active": -1, "_id": -1}
+    to_delete = []
+    async for group in find_duplicates(collection, "user_id", sort):
+        keep, *rest = group["docs"]
+        favorites = list(keep.get("favorite_games") or [])
+        for doc in rest:
+            favorites.extend(game_id for game_id in doc.get("favorite_games") or [] if game_id not in favorites)
+        await collection.update_one({"_id": keep["_id"]}, {"$set": {"favorite_games": favorites}})
+        to_delete.extend(doc["_id"] for doc in rest)
+    return await delete_ids(collection, to_delete)
+
+
+async def ensure_unique_index(collection, key: str):
+    """删除同名的非唯一索引后创建唯一索引 (已是唯一索引时不做修改)"""
+    name = f"{key}_1"
+    indexes = await collection.index_information()
+    if name in indexes:
+        if indexes[name].get("unique"):
+            print(f"  ○ {collection.name}.{name} 已是唯一索引")
+            return
+        await collection.drop_index(name)
+        print(f"  ✓ 已删除非唯一索引 {collection.name}.{name}")
+    await collection.create_index([(key, ASCENDING)], unique=True, name=name)
+    print(f"  ✓ 已创建唯一索引 {collection.name}.{name}")
+
+
+async def main():
+    client = AsyncIOMotorClient(MONGODB_URL)
+    db = client[DATABASE_NAME]
+    print(f"✓ 数据库已连接: {DATABASE_NAME}")
+
+    removed_games = await dedupe_games(db)
+    print(f"去重: 删除 {removed_games} 条重复游戏")
+    removed_users = await dedupe_users(db)
+    print(f"去重: 合并删除 {removed_users} 条重复用户")
+
+    await ensure_unique_index(db["games"], "app_id")
+    await ensure_unique_index(db["users"], "user_id")
+    print("完成!")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -7,18 +7,45 @@
 """
 import asyncio
 import httpx
+import orjson
 from motor.motor_asyncio import AsyncIOMotorClient
 from beanie import init_beanie
+from pymongo.errors import BulkWriteError
+import logging
 import os
+import queue
 import sys
+from logging.handlers import QueueHandler, QueueListener
 
 sys.path.insert(0, '/app')
-from app.models import Game
+from app.models import Game, normalize_genres
 
 MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://mongodb:27017")
 DATABASE_NAME = os.getenv("DATABASE_NAME", "steamgamerec")
 STEAMSPY_BASE_URL = "https://steamspy.com/api.php"
 
+# 同时进行的详情请求数
+DETAIL_CONCURRENCY = 5
+
+# MongoDB重复键错误码 (违反app_id唯一索引)
+DUPLICATE_KEY_ERROR = 11000
+
+logger = logging.getLogger("quick_import")
+
+
+def start_logging() -> QueueListener:
+    """日志经队列交给后台线程写入stdout, 事件循环中不直接执行输出; 退出前需调用stop()"""
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter("%(message)s"))
+    listener = QueueListener(log_queue, stream_handler)
+    
+    logger.addHandler(QueueHandler(log_queue))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    listener.start()
+    return listener
+
 
 async def init_db():
     """初始化数据库"""
@@ -27,39 +54,66 @@ async def init_db():
         database=client[DATABASE_NAME],
         document_models=[Game]
     )
-    print("✓ 数据库已连接")
+    logger.info("✓ 数据库已连接")
 
 
 async def fetch_and_save_top_games(limit=100):
     """获取并保存热门游戏"""
-    print(f"正在获取前 {limit} 款热门游戏...")
+    logger.info("正在获取前 %d 款热门游戏...", limit)
     
     async with httpx.AsyncClient(timeout=60.0) as client:
         # 获取热门游戏列表
         url = f"{STEAMSPY_BASE_URL}?request=top100in2weeks"
         response = await client.get(url)
-        data = response.json()
+        data = orjson.loads(response.content)
         
         top_games = list(data.items())[:limit]
-        print(f"获取到 {len(top_games)} 款游戏")
+        logger.info("获取到 %d 款游戏", len(top_games))
         
         success = 0
         skip = 0
+        pending = []  # 获取成功的游戏, 循环结束后一次性写入
+        
+        top_app_ids = [int(app_id) for app_id, _ in top_games]
+        
+        # 一次$in查询找出已存在的游戏, 代替逐个find_one; 只返回app_id (不传输description等字段)
+        cursor = Game.get_motor_collection().find(
+            {"app_id": {"$in": top_app_ids}},
+            {"_id": 0, "app_id": 1}
+        )
+        existing_ids = {doc["app_id"] async for doc in cursor}
+        
+        # 已存在的游戏直接计入跳过, 只有待获取的游戏发起HTTP请求
+        skip += len(existing_ids)
+        to_fetch = [app_id for app_id in top_app_ids if app_id not in existing_ids]
+        
+        # 并发获取详细信息, 信号量限制同时进行的请求数
+        semaphore = asyncio.Semaphore(DETAIL_CONCURRENCY)
+        completed = 0  # 已返回 (含失败) 的详情请求数, 用于获取过程中的进度输出
+        
+        async def fetch_detail(app_id: int):
+            nonlocal completed
+            async with semaphore:
+                try:
+                    detail_url = f"{STEAMSPY_BASE_URL}?request=appdetails&appid={app_id}"
+                    detail_response = await client.get(detail_url)
+                finally:
+                    completed += 1
+                    if completed % 10 == 0:
+                        logger.info("进度: %d/%d (跳过已存在: %d)", completed, len(to_fetch), skip)
+                # 避免API限流 (每个并发槽位请求后等待)
+                await asyncio.sleep(0.5)
+                return orjson.loads(detail_response.content)
+        
+        details = await asyncio.gather(
+            *(fetch_detail(app_id) for app_id in to_fetch),
+            return_exceptions=True
+        )
         
-        for i, (app_id, game_basic) in enumerate(top_games, 1):
+        for app_id, detail_data in zip(to_fetch, details):
             try:
-                app_id = int(app_id)
-                
-                # 检查是否已存在
-                existing = await Game.find_one(Game.app_id == app_id)
-                if existing:
-                    skip += 1
-                    continue
-                
-                # 获取详细信息
-                detail_url = f"{STEAMSPY_BASE_URL}?request=appdetails&appid={app_id}"
-                detail_response = await client.get(detail_url)
-                detail_data = detail_response.json()
+                if isinstance(detail_data, Exception):
+                    raise detail_data
                 
                 if not detail_data.get('name'):
                     continue
@@ -76,26 +130,30 @@ async def fetch_and_save_top_games(limit=100):
                     app_id=app_id,
                     name=detail_data.get("name", "Unknown"),
                     price=price,
-                    genres=detail_data.get("genre", "").split(", ") if detail_data.get("genre") else [],
+                    genres=normalize_genres(detail_data.get("genre")),
                     description=detail_data.get("short_description", ""),
                     release_date=detail_data.get("release_date", "Unknown"),
                     positive_reviews=detail_data.get("positive", 0),
                     negative_reviews=detail_data.get("negative", 0),
                 )
                 
-                await game.insert()
-                success += 1
-                
-                if i % 10 == 0:
-                    print(f"进度: {i}/{len(top_games)} (成功: {success}, 跳过: {skip})")
-                
-                # 避免API限流
-                await asyncio.sleep(0.5)
+                # insert_many不会触发Beanie的before_event钩子
+                game.compute_derived_fields()
+                pending.append(game)
                 
             except Exception as e:
-                print(f"处理游戏 {app_id} 失败: {e}")
+                logger.warning("处理游戏 %s 失败: %s", app_id, e)
+        
+        # 一次往返批量写入; ordered=False 使已存在的游戏不影响其余文档
+        if pending:
+            try:
+                result = await Game.insert_many(pending, ordered=False)
+                success = len(result.inserted_ids)
+            except BulkWriteError as e:
+                success = e.details.get("nInserted", 0)
+                skip += sum(1 for err in e.details.get("writeErrors", []) if err.get("code") == DUPLICATE_KEY_ERROR)
         
-        print(f"\n完成! 成功: {success}, 跳过: {skip}")
+        logger.info("\n完成! 成功: %d, 跳过: %d", success, skip)
 
 
 async def main():
@@ -104,4 +162,8 @@ async def main():
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    listener = start_logging()
+    try:
+        asyncio.run(main())
+    finally:
+        listener.stop()